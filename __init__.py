@@ -3,17 +3,36 @@ import logging
 import asyncio
 import aiohttp
 import async_timeout
-import re
-from datetime import timedelta, datetime
+from functools import partial
+from datetime import datetime, timezone
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 from homeassistant.exceptions import ConfigEntryError
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.util.json import json_loads
 from .const import (
-    DOMAIN, CONF_POSTCODE, CONF_DISTANCE, CONF_API_KEY, FUEL_TYPE_NAMES,
-    UPDATE_INTERVAL, PETROL_PRICES_API_BASE_URL, PETROLMAP_API_URL, GEOCODE_API_URL,
-    API_TIMEOUT, PRICE_AGE_LIMIT_DAYS, DEFAULT_BRAND_TYPE, DEFAULT_RESULT_LIMIT,
-    DEFAULT_OFFSET, DEFAULT_SORT_TYPE
+    DOMAIN, CONF_POSTCODE, CONF_DISTANCE, CONF_API_KEY, CONF_HOURLY_BUDGET, FUEL_TYPE_NAMES,
+    API_GUEST_HOURLY_LIMIT,
+    PETROL_PRICES_API_BASE_URL,
+    API_TIMEOUT, DEFAULT_BRAND_TYPE, DEFAULT_RESULT_LIMIT,
+    DEFAULT_OFFSET, DEFAULT_SORT_TYPE, PAGE_SIZE, PAGE_WINDOW, MAX_PAGES, PAGE_MIN_STATIONS,
+    API_RATE_LIMIT_MAX_WAIT, API_FIRST_REFRESH_MAX_WAIT, PLATFORMS, SIGNAL_METRICS_UPDATED
 )
+from .cloudflare import async_get_cloudflare_session
+from .api import (
+    async_get_domain_data, async_get_session, async_close_session, async_get_rate_limiter,
+    async_get_single_flight, async_get_response_cache
+)
+from .geo import plan_query_region
+from .coordinator import PetrolMapCoordinator, get_entry_config
+from .features import async_enrich_stations
+from .geocode import async_geocode_postcode
+from .history import async_get_price_history
+from .metrics import async_get_metrics
+from .models import parse_feature_collection, carry_forward_prices
+from .scheduler import RefreshScheduler, count_price_changes, startup_slot_key
+from .services import async_register_services, async_unregister_services
+from .snapshot import async_load_snapshot, async_save_snapshot, async_remove_snapshot
+from .spatial import async_get_station_index
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -21,239 +40,401 @@ async def async_setup_entry(hass: HomeAssistant, config_entry):
     """Set up PetrolMap from a config entry."""
     _LOGGER.debug(f"Setting up config entry: {config_entry.data}")
     
-    if DOMAIN not in hass.data:
-        hass.data[DOMAIN] = {"last_data": {}, "known_stations": set(), "cf_cookies": {}}
-        _LOGGER.debug(f"Initialized hass.data[{DOMAIN}] with last_data, known_stations, and cf_cookies")
-    
-    coordinator = DataUpdateCoordinator(
+    async_get_domain_data(hass)
+    budget = get_entry_config(config_entry).get(CONF_HOURLY_BUDGET, API_GUEST_HOURLY_LIMIT)
+    _async_apply_budget(hass, config_entry.entry_id, budget)
+
+    await async_get_price_history(hass)
+    snapshot = await async_load_snapshot(hass, config_entry.entry_id, get_entry_config(config_entry))
+    scheduler = RefreshScheduler(
+        config_entry.entry_id, budget, startup_slot_key(snapshot.get("center") if snapshot else None)
+    )
+    # Setup must not sit in the shared quota queue: the first refresh only takes tokens that
+    # come free quickly, and fuel types it skips are retried by the scheduler in the background
+    coordinator = PetrolMapCoordinator(
         hass,
-        _LOGGER,
-        name=DOMAIN,
-        update_method=lambda: async_update_data(hass, config_entry),
-        update_interval=UPDATE_INTERVAL,
+        lambda: async_update_data(
+            hass, config_entry, scheduler,
+            API_FIRST_REFRESH_MAX_WAIT if coordinator.data is None else API_RATE_LIMIT_MAX_WAIT,
+        ),
+        scheduler,
     )
-    try:
-        await coordinator.async_config_entry_first_refresh()
-    except ConfigEntryError as e:
-        _LOGGER.error(f"Initial refresh failed: {str(e)}")
-        raise
-    except Exception as e:
-        _LOGGER.error(f"Unexpected error during initial refresh: {str(e)}")
-        raise ConfigEntryError(f"Unexpected error during setup: {str(e)}")
+    if snapshot is not None:
+        # Come up with the last known prices straight away; the scheduler staggers the
+        # first refresh so entries restored together don't all hit the API at once
+        hass.data[DOMAIN]["last_data"][config_entry.entry_id] = snapshot
+        coordinator.async_set_updated_data(snapshot)
+    else:
+        try:
+            await coordinator.async_config_entry_first_refresh()
+        except ConfigEntryError as e:
+            _LOGGER.error(f"Initial refresh failed: {str(e)}")
+            raise
+        except Exception as e:
+            _LOGGER.error(f"Unexpected error during initial refresh: {str(e)}")
+            raise ConfigEntryError(f"Unexpected error during setup: {str(e)}")
 
     hass.data[DOMAIN][config_entry.entry_id] = coordinator
     _LOGGER.debug(f"Set hass.data[{DOMAIN}][{config_entry.entry_id}] with coordinator")
     
-    await hass.config_entries.async_forward_entry_setups(config_entry, ["sensor"])
+    await hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
+    async_register_services(hass)
+    config_entry.async_on_unload(config_entry.add_update_listener(_async_options_updated))
     return True
 
-async def async_update_data(hass: HomeAssistant, config_entry):
-    """Fetch data from PetrolPrices and PetrolMap APIs."""
-    _LOGGER.debug(f"Starting async_update_data for config entry: {config_entry.data}")
-    postcode = config_entry.data[CONF_POSTCODE]
-    distance = config_entry.data[CONF_DISTANCE]
-    api_key = config_entry.data.get(CONF_API_KEY, "")
+def _async_apply_budget(hass: HomeAssistant, entry_id, budget=None):
+    """Record an entry's hourly request budget and apply the strictest one to the shared limiter."""
+    budgets = hass.data[DOMAIN].setdefault("budgets", {})
+    if budget is None:
+        budgets.pop(entry_id, None)
+    else:
+        budgets[entry_id] = budget
+    if budgets:
+        async_get_rate_limiter(hass).set_hourly_limit(min(budgets.values()))
+
+async def _async_options_updated(hass: HomeAssistant, config_entry):
+    """Reload the entry so changed options take effect."""
+    await hass.config_entries.async_reload(config_entry.entry_id)
+
+async def async_unload_entry(hass: HomeAssistant, config_entry):
+    """Unload a PetrolMap config entry."""
+    unload_ok = await hass.config_entries.async_unload_platforms(config_entry, PLATFORMS)
+    if unload_ok:
+        hass.data[DOMAIN].pop(config_entry.entry_id, None)
+        hass.data[DOMAIN].get("areas", {}).pop(config_entry.entry_id, None)
+        _async_apply_budget(hass, config_entry.entry_id)
+        remaining = [
+            entry for entry in hass.config_entries.async_entries(DOMAIN)
+            if entry.entry_id in hass.data[DOMAIN]
+        ]
+        if not remaining:
+            hass.data[DOMAIN].pop("single_flight", None)
+            async_unregister_services(hass)
+            await async_close_session(hass)
+    return unload_ok
+
+async def async_remove_config_entry_device(hass: HomeAssistant, config_entry, device_entry):
+    """Allow deleting a station device once the entry no longer reports that station."""
+    coordinator = hass.data[DOMAIN].get(config_entry.entry_id)
+    if coordinator is None:
+        return True
+    return not any(
+        coordinator.get_station(station_id) for domain, station_id in device_entry.identifiers if domain == DOMAIN
+    )
+
+async def async_remove_entry(hass: HomeAssistant, config_entry):
+    """Remove persisted data of a deleted PetrolMap config entry."""
+    async_get_domain_data(hass)
+    await async_remove_snapshot(hass, config_entry.entry_id)
+
+async def async_update_data(hass: HomeAssistant, config_entry, scheduler, max_wait=API_RATE_LIMIT_MAX_WAIT):
+    """Fetch data from PetrolPrices and PetrolMap APIs, timing each phase."""
+    timer = async_get_metrics(hass).refresh_timer(config_entry.entry_id)
+    try:
+        result = await _async_update_data(hass, config_entry, scheduler, timer, max_wait)
+        timer.finish(len(result.get("stations") or {}))
+        return result
+    except Exception:
+        timer.finish(None, success=False)
+        raise
+    finally:
+        async_dispatcher_send(hass, SIGNAL_METRICS_UPDATED)
+
+async def _async_update_data(hass: HomeAssistant, config_entry, scheduler, timer, max_wait):
+    _LOGGER.debug("Starting refresh for entry_id %s", config_entry.entry_id)
+    config = get_entry_config(config_entry)
+    postcode = config[CONF_POSTCODE]
+    distance = config[CONF_DISTANCE]
+    api_key = config.get(CONF_API_KEY, "")
     fuel_types = [1, 2, 4, 5]  # All fuel types
 
-    async with aiohttp.ClientSession() as session:
-        # Geocode postcode using Nominatim with fallback to FreeMapTools
-        lat, lng = None, None
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                async with async_timeout.timeout(API_TIMEOUT):
-                    geocode_url = f"{GEOCODE_API_URL}?q={postcode}&format=json&limit=1"
-                    headers = {"User-Agent": "HomeAssistant/1.0"}
-                    _LOGGER.debug(f"Attempting Nominatim geocoding for postcode {postcode}")
-                    async with session.get(geocode_url, headers=headers) as response:
-                        if response.status != 200:
-                            text = await response.text()
-                            _LOGGER.warning(f"Nominatim geocoding failed with status {response.status}: {text}")
-                            break
-                        geocode_data = await response.json()
-                        if not geocode_data:
-                            _LOGGER.warning(f"No coordinates found for postcode {postcode} in Nominatim")
-                            break
-                        lat = float(geocode_data[0]["lat"])
-                        lng = float(geocode_data[0]["lon"])
-                        _LOGGER.debug(f"Geocoded {postcode} to lat: {lat}, lng: {lng}")
-                        break
-            except Exception as e:
-                _LOGGER.warning(f"Nominatim geocoding error on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)
-                    continue
-                break
+    session = async_get_session(hass)
+    with timer.phase("geocode"):
+        lat, lng = await async_geocode_postcode(hass, session, postcode)
+
+    # Cloudflare cookies and cf-token, re-scraped only when they are about to expire
+    cloudflare = await async_get_cloudflare_session(hass)
+    with timer.phase("cloudflare"):
+        await cloudflare.async_ensure(session)
+
+    # Fetch fuel prices from PetrolPrices
+    stations = {}
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36",
+        "accept": "*/*",
+        "accept-encoding": "gzip, deflate, br",
+        "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
+    }
+    if api_key:
+        headers["authorization"] = f"Bearer {api_key}"
+
+    # Neighbouring entries share one enclosing query; stations are filtered back to this entry's circle below
+    areas = hass.data[DOMAIN].setdefault("areas", {})
+    areas[config_entry.entry_id] = (lat, lng, distance, api_key)
+    query_lat, query_lng, query_radius = plan_query_region(areas, config_entry.entry_id)
+    # Entries of one region refresh together and share its requests, so budget and phase are per region
+    scheduler.active_regions = len({
+        (*plan_query_region(areas, other_id), areas[other_id][3]) for other_id in areas
+    })
+    scheduler.join_region(
+        hass.data[DOMAIN].setdefault("region_phases", {}), (query_lat, query_lng, query_radius, api_key)
+    )
+    due = scheduler.fuel_types_due(fuel_types)
 
-        # Fallback to FreeMapTools if Nominatim fails
-        if lat is None or lng is None:
-            _LOGGER.debug(f"Falling back to FreeMapTools for postcode {postcode}")
-            try:
-                async with async_timeout.timeout(API_TIMEOUT):
-                    fallback_url = f"https://www.freemaptools.com/ajax/uk/uk-postcode-to-lat-lng.php?postcode={postcode}&alsosearchterminated=true"
-                    headers = {
-                        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36",
-                        "accept": "*/*",
-                        "accept-encoding": "gzip, deflate, br",
-                        "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
-                        "referer": "https://www.freemaptools.com/convert-uk-postcode-to-lat-lng.htm"
-                    }
-                    async with session.get(fallback_url, headers=headers) as response:
-                        if response.status != 200:
-                            text = await response.text()
-                            _LOGGER.error(f"FreeMapTools geocoding failed with status {response.status}: {text}")
-                            raise ConfigEntryError(f"FreeMapTools geocoding failed with status {response.status}")
-                        geocode_data = await response.json()
-                        if geocode_data.get("status") != 1 or not geocode_data.get("output"):
-                            _LOGGER.error(f"Invalid FreeMapTools geocoding data: {geocode_data}")
-                            raise ConfigEntryError("Invalid FreeMapTools geocoding response")
-                        lat = float(geocode_data["output"][0]["latitude"])
-                        lng = float(geocode_data["output"][0]["longitude"])
-                        _LOGGER.debug(f"FreeMapTools geocoded {postcode} to lat: {lat}, lng: {lng}")
-            except Exception as e:
-                _LOGGER.error(f"FreeMapTools geocoding error: {str(e)}")
-                raise ConfigEntryError(f"Geocoding failed after retries: {str(e)}")
-
-        if lat is None or lng is None:
-            raise ConfigEntryError(f"No coordinates found for postcode {postcode} after all attempts")
-
-        # Scrape Cloudflare cookies
-        if not hass.data[DOMAIN]["cf_cookies"]:
-            try:
-                async with async_timeout.timeout(API_TIMEOUT):
-                    headers = {
-                        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36",
-                        "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-                        "accept-encoding": "gzip, deflate, br",
-                        "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
-                    }
-                    async with session.get("https://www.petrolprices.com", headers=headers) as response:
-                        if response.status != 200:
-                            _LOGGER.warning(f"Failed to scrape Cloudflare cookies: status {response.status}")
-                        else:
-                            cookies = response.cookies
-                            hass.data[DOMAIN]["cf_cookies"] = {key: value.value for key, value in cookies.items()}
-                            _LOGGER.debug(f"Scraped Cloudflare cookies: {hass.data[DOMAIN]['cf_cookies']}")
-                            # Attempt to extract token from response headers or body
-                            text = await response.text()
-                            token_match = re.search(r'"cf-token":"([^"]+)"', text)
-                            hass.data[DOMAIN]["cf_token"] = token_match.group(1) if token_match else "default_token"
-            except Exception as e:
-                _LOGGER.warning(f"Failed to scrape Cloudflare cookies: {str(e)}")
-                hass.data[DOMAIN]["cf_token"] = "default_token"
-
-        # Fetch fuel prices from PetrolPrices
-        stations = {}
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36",
-            "accept": "*/*",
-            "accept-encoding": "gzip, deflate, br",
-            "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
-        }
-        if api_key:
-            headers["authorization"] = f"Bearer {api_key}"
-        if hass.data[DOMAIN].get("cf_token"):
-            headers["cf-token"] = hass.data[DOMAIN]["cf_token"]
-
-        max_retries = 3
-        for fuel_type in fuel_types:
-            url = PETROL_PRICES_API_BASE_URL.format(
-                fuel_type=fuel_type,
-                brand_type=DEFAULT_BRAND_TYPE,
-                result_limit=DEFAULT_RESULT_LIMIT,
-                offset=DEFAULT_OFFSET,
-                sort_type=DEFAULT_SORT_TYPE,
-                radius=distance,
-                lat=lat,
-                lng=lng
+    limiter = async_get_rate_limiter(hass)
+    flight = async_get_single_flight(hass)
+    fetch = partial(_async_fetch_fuel_type, hass, session, cloudflare, limiter, max_wait=max_wait)
+
+    def query_url(fuel_type, result_limit=DEFAULT_RESULT_LIMIT, offset=DEFAULT_OFFSET):
+        return PETROL_PRICES_API_BASE_URL.format(
+            fuel_type=fuel_type,
+            brand_type=DEFAULT_BRAND_TYPE,
+            result_limit=result_limit,
+            offset=offset,
+            sort_type=DEFAULT_SORT_TYPE,
+            radius=query_radius,
+            lat=query_lat,
+            lng=query_lng
+        )
+
+    now = datetime.now(timezone.utc)
+    previous = hass.data[DOMAIN]["last_data"].get(config_entry.entry_id, {}).get("stations", {})
+    # Stations each upstream query returned last time, so API key entries only page queries known to be large
+    query_sizes = hass.data[DOMAIN].setdefault("query_sizes", {})
+    paged = _plan_pages(
+        limiter.available, {fuel_type: query_sizes.get((query_url(fuel_type), api_key)) for fuel_type in due}
+    ) if api_key else {}
+    requests = {fuel_type: 1 for fuel_type in due}
+    with timer.phase("fetch"):
+        fetched = await asyncio.gather(*(
+            _async_fetch_fuel_type_pages(
+                flight, fetch, api_key, query_url, fuel_type, paged[fuel_type], headers, stations, now, requests
+            )
+            if fuel_type in paged else
+            flight.async_do((query_url(fuel_type), api_key), partial(fetch, fuel_type, query_url(fuel_type), headers))
+            for fuel_type in due
+        ))
+    for fuel_type, data in zip(due, fetched):
+        if isinstance(data, dict):
+            query_sizes[(query_url(fuel_type), api_key)] = len((data.get("data") or {}).get("features") or ())
+        elif data is not None:
+            query_sizes[(query_url(fuel_type), api_key)] = data
+    if api_key and len(due) == len(fuel_types):
+        scheduler.requests_per_refresh = sum(requests.values())
+    # Fuel types not due this time keep their previous prices
+    results = [fetched[due.index(fuel_type)] if fuel_type in due else None for fuel_type in fuel_types]
+
+    with timer.phase("parse"):
+        for fuel_type, data in zip(fuel_types, results):
+            if data is None:
+                carry_forward_prices(previous, stations, fuel_type)
+            elif isinstance(data, dict):
+                parse_feature_collection(data, fuel_type, stations, now)
+            # Otherwise a station count: the pages were merged as they arrived
+
+    # Index everything fetched, then keep the stations inside this entry's own circle
+    index = await async_get_station_index(hass)
+    with timer.phase("filter"):
+        index.async_update(stations)
+        if (query_lat, query_lng, query_radius) != (lat, lng, distance):
+            nearby = {station.id: station for _, station in index.within_radius(lat, lng, distance, stations)}
+            nearby.update(
+                (station_id, station) for station_id, station in stations.items() if station.latitude is None
             )
-            _LOGGER.debug(f"PetrolPrices API URL for fuel type {fuel_type}: {url}")
-            for attempt in range(max_retries):
-                try:
+            stations = nearby
+
+    succeeded = [fuel_type for fuel_type, data in zip(due, fetched) if data is not None]
+    scheduler.record_result(
+        due,
+        [fuel_type for fuel_type in due if fuel_type not in succeeded],
+        count_price_changes(previous, stations, succeeded),
+    )
+
+    # Attach PetrolMap facilities, fetching only for stations missing from the feature cache
+    with timer.phase("features"):
+        await async_enrich_stations(hass, session, stations, postcode, distance)
+    history = await async_get_price_history(hass)
+    with timer.phase("history"):
+        history.async_record(stations, now)
+
+    if not stations:
+        _LOGGER.warning("No valid stations with prices found, returning cached data")
+        return hass.data[DOMAIN].get("last_data", {}).get(config_entry.entry_id, {})
+
+    result = {"stations": stations, "center": (lat, lng)}
+    hass.data[DOMAIN]["last_data"][config_entry.entry_id] = result
+    async_save_snapshot(hass, config_entry.entry_id, result, config)
+    _LOGGER.debug("Cached result for entry_id %s", config_entry.entry_id)
+    return result
+
+def _plan_pages(available, sizes):
+    """Return fuel type -> page count for the queries worth fetching in pages.
+
+    sizes maps each due fuel type to the stations its query returned last time, or
+    None if unknown. Only queries of at least PAGE_MIN_STATIONS, where one response
+    is large enough for its memory to matter, are paged. Every fuel type costs one
+    request regardless, so a query is only paged when the tokens on hand cover its
+    extra pages; otherwise it stays a single unpaged request that may queue for
+    quota like any other.
+    """
+    spare = available - len(sizes)
+    plan = {}
+    for fuel_type, size in sizes.items():
+        if size is None or size < PAGE_MIN_STATIONS:
+            continue
+        pages = size // PAGE_SIZE + 1  # A short or empty last page marks the end
+        if 1 < pages <= min(MAX_PAGES, spare + 1):
+            plan[fuel_type] = pages
+            spare -= pages - 1
+    return plan
+
+async def _async_fetch_fuel_type_pages(flight, fetch, api_key, query_url, fuel_type, pages, headers, stations, now, requests):
+    """Fetch one fuel type in PAGE_SIZE pages and merge each page into stations as it arrives.
+
+    The planned pages are requested up to PAGE_WINDOW at once, each only if a
+    token is free right now, and page bodies are neither coalesced nor cached so
+    only the pages in flight are held in memory. Pages past the first short one
+    are cancelled before they are sent. If a page cannot be fetched, the fuel type
+    falls back to the single unpaged request. Returns the number of stations
+    merged, or the unpaged response (None if that was skipped too). requests[fuel_type]
+    is set to the number of requests made.
+    """
+    async def fetch_page(page):
+        requests[fuel_type] = requests.get(fuel_type, 0) + 1
+        url = query_url(fuel_type, PAGE_SIZE, page * PAGE_SIZE)
+        return page, await fetch(fuel_type, url, headers, revalidate=False, max_wait=0)
+
+    requests[fuel_type] = 0
+    pending = {}  # task -> page
+    next_page, last_page, complete, merged = 0, None, True, 0
+    try:
+        while True:
+            while complete and last_page is None and len(pending) < PAGE_WINDOW and next_page < MAX_PAGES:
+                if next_page >= pages and pending:
+                    break  # Past the plan: only continue once the pages in flight all came back full
+                pending[asyncio.ensure_future(fetch_page(next_page))] = next_page
+                next_page += 1
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del pending[task]
+                page, data = task.result()
+                if data is None:
+                    complete = False
+                    continue
+                features = (data.get("data") or {}).get("features") or ()
+                merged += len(features)
+                parse_feature_collection(data, fuel_type, stations, now)
+                if len(features) < PAGE_SIZE:
+                    last_page = page if last_page is None else min(last_page, page)
+            for task, page in list(pending.items()):
+                if not complete or (last_page is not None and page > last_page):
+                    task.cancel()
+                    del pending[task]
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if not complete:
+        _LOGGER.debug("Paged fetch of fuel type %s ran out of free tokens, falling back to one request", fuel_type)
+        requests[fuel_type] += 1
+        url = query_url(fuel_type)
+        return await flight.async_do((url, api_key), partial(fetch, fuel_type, url, headers))
+    if last_page is None:
+        _LOGGER.warning(f"Stopped paging fuel type {fuel_type} after {MAX_PAGES} pages")
+    _LOGGER.debug("Fetched fuel type %s in %d pages of %d", fuel_type, next_page, PAGE_SIZE)
+    return merged
+
+async def _async_fetch_fuel_type(
+    hass: HomeAssistant, session, cloudflare, limiter, fuel_type, url, headers, revalidate=True,
+    max_wait=API_RATE_LIMIT_MAX_WAIT
+):
+    """Fetch one fuel type from PetrolPrices within the shared request budget.
+
+    Returns the decoded response, or None if the fuel type should be skipped this refresh.
+    With revalidate the decoded response is cached with its ETag for the next request.
+    """
+    _LOGGER.debug("PetrolPrices API URL for fuel type %s: %s", fuel_type, url)
+    metrics = async_get_metrics(hass)
+    response_cache = async_get_response_cache(hass)
+    cache_key = (url, headers.get("authorization"))
+    cached = response_cache.get(cache_key) if revalidate else None
+    if cached is not None:
+        headers = {**headers, "If-None-Match": cached[0]}
+    max_retries = 3
+    reauthenticated = False
+    for attempt in range(max_retries):
+        if not await limiter.async_acquire(max_wait):
+            _LOGGER.warning(f"Request quota exhausted for fuel type {fuel_type}, skipping until next refresh")
+            metrics.count("quota_skipped")
+            return None
+        metrics.count("requests")
+        if attempt:
+            metrics.count("retries")
+        generation = cloudflare.generation
+        try:
+            async with limiter.concurrency:
+                with metrics.timed(f"fetch_fuel_{fuel_type}"):
                     async with async_timeout.timeout(API_TIMEOUT):
-                        async with session.get(url, headers=headers, cookies=hass.data[DOMAIN]["cf_cookies"]) as response:
+                        async with session.get(
+                            url, headers={**headers, **cloudflare.headers}, cookies=cloudflare.cookies
+                        ) as response:
+                            if response.status == 304 and cached is not None:
+                                _LOGGER.debug("PetrolPrices response for fuel type %s not modified, reusing cached data", fuel_type)
+                                metrics.count("not_modified")
+                                return cached[1]
                             if response.status == 429:
-                                if attempt < max_retries - 1:
-                                    wait_time = 2 ** attempt
-                                    _LOGGER.warning(f"Rate limit hit for fuel type {fuel_type}, retrying after {wait_time}s")
-                                    await asyncio.sleep(wait_time)
-                                    continue
-                                _LOGGER.warning(f"Rate limit exceeded for fuel type {fuel_type}, skipping")
-                                break
-                            if response.status == 401 or response.status == 403:
+                                metrics.count("rate_limited")
+                                if attempt == max_retries - 1:
+                                    _LOGGER.warning(f"Rate limit exceeded for fuel type {fuel_type}, skipping")
+                                    return None
+                            elif response.status == 403 and not reauthenticated:
+                                _LOGGER.debug("PetrolPrices refused fuel type %s, refreshing the Cloudflare session", fuel_type)
+                                metrics.count("cloudflare_reauth")
+                            elif response.status == 401 or response.status == 403:
                                 _LOGGER.error(f"PetrolPrices API unauthorized for fuel type {fuel_type}")
                                 raise ConfigEntryError(f"PetrolPrices API requires valid API key")
-                            if response.status != 200:
+                            elif response.status != 200:
                                 text = await response.text()
                                 _LOGGER.error(f"API request failed for fuel type {fuel_type} with status {response.status}: {text}")
                                 raise ConfigEntryError(f"API request failed with status {response.status}")
-                            data = await response.json()
-                            _LOGGER.debug(f"PetrolPrices API response for fuel type {fuel_type}: {data}")
-                            if data.get("limitExceed"):
-                                _LOGGER.warning(f"Rate limit exceeded in response for fuel type {fuel_type}")
-                                break
-                            for feature in data.get("stations", []):
-                                station_id = str(feature["idstation"])
-                                price = feature.get("price", 0) / 10  # Convert pence to GBP
-                                if price <= 0:
-                                    continue
-                                if station_id not in stations:
-                                    stations[station_id] = {
-                                        "id": station_id,
-                                        "name": feature.get("name", "Unknown"),
-                                        "address": feature.get("address", "Unknown"),
-                                        "postcode": feature.get("postcode", "Unknown"),
-                                        "latitude": feature.get("latitude", lat),
-                                        "longitude": feature.get("longitude", lng),
-                                        "prices": {},
-                                        "last_updated": feature.get("recordedtime"),
-                                        "brand": feature.get("fuelbrand", "Unknown"),
-                                        "features": [],
-                                    }
-                                if (datetime.now().astimezone() - datetime.fromisoformat(feature.get("recordedtime", "").replace("Z", "+00:00"))).days <= PRICE_AGE_LIMIT_DAYS:
-                                    stations[station_id]["prices"][str(fuel_type)] = price
-                except aiohttp.ClientError as e:
-                    if attempt < max_retries - 1:
-                        wait_time = 2 ** attempt
-                        _LOGGER.warning(f"Client error for fuel type {fuel_type}, retrying after {wait_time}s: {str(e)}")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    _LOGGER.warning(f"API client error for fuel type {fuel_type}, skipping: {str(e)}")
-                    break
-                except Exception as e:
-                    _LOGGER.error(f"Unexpected API error for fuel type {fuel_type}: {str(e)}")
-                    raise ConfigEntryError(f"Unexpected API error: {str(e)}")
-
-        # Fetch station features from PetrolMap for new stations
-        new_stations = set(stations.keys()) - hass.data[DOMAIN]["known_stations"]
-        if new_stations or not hass.data[DOMAIN]["known_stations"]:
-            _LOGGER.debug(f"Fetching PetrolMap for {len(new_stations)} new stations")
-            petrolmap_url = f"{PETROLMAP_API_URL}?address={postcode}&fuel_type=petrol&search_type=postcode&brand=any&distance={distance}&p=map"
-            try:
-                async with async_timeout.timeout(API_TIMEOUT):
-                    async with session.get(petrolmap_url, headers=headers) as response:
-                        if response.status != 200:
-                            _LOGGER.warning(f"PetrolMap API failed with status {response.status}")
-                            petrolmap_data = {"success": False, "data": []}
-                        else:
-                            petrolmap_data = await response.json()
-                            for pm_station in petrolmap_data.get("data", []):
-                                pm_postcode = pm_station.get("Postcode", "").replace(" ", "").upper()
-                                for station_id, station in stations.items():
-                                    pp_postcode = station["postcode"].replace(" ", "").upper()
-                                    if pm_postcode == pp_postcode:
-                                        station["features"] = pm_station.get("Features", [])
-                                        break
-            except Exception as e:
-                _LOGGER.warning(f"PetrolMap API error, proceeding without features: {str(e)}")
-                petrolmap_data = {"success": False, "data": []}
-            hass.data[DOMAIN]["known_stations"].update(new_stations)
-
-        if not stations:
-            _LOGGER.warning("No valid stations with prices found, returning cached data")
-            return hass.data[DOMAIN].get("last_data", {}).get(config_entry.entry_id, {})
-
-        result = {"stations": stations}
-        hass.data[DOMAIN]["last_data"][config_entry.entry_id] = result
-        _LOGGER.debug(f"Cached result for entry_id {config_entry.entry_id}")
-        return result
\ No newline at end of file
+                            else:
+                                body = await response.read()
+                                # Content-Length is the compressed size on the wire; the body is already decoded
+                                metrics.count("bytes_transferred", response.content_length or 0)
+                                metrics.count("bytes_decoded", len(body))
+                                data = json_loads(body)
+                                _LOGGER.debug("PetrolPrices API returned %d bytes for fuel type %s", len(body), fuel_type)
+                                if data.get("limitExceed"):
+                                    _LOGGER.warning(f"Rate limit exceeded in response for fuel type {fuel_type}")
+                                    metrics.count("limit_exceeded")
+                                    return None
+                                etag = response.headers.get("ETag")
+                                if etag and revalidate:
+                                    response_cache.set(cache_key, etag, data)
+                                return data
+        except aiohttp.ClientError as e:
+            metrics.count("client_errors")
+            if attempt < max_retries - 1:
+                wait_time = 2 ** attempt
+                _LOGGER.warning(f"Client error for fuel type {fuel_type}, retrying after {wait_time}s: {str(e)}")
+                await asyncio.sleep(wait_time)
+                continue
+            _LOGGER.warning(f"API client error for fuel type {fuel_type}, skipping: {str(e)}")
+            return None
+        except ConfigEntryError:
+            raise
+        except Exception as e:
+            _LOGGER.error(f"Unexpected API error for fuel type {fuel_type}: {str(e)}")
+            raise ConfigEntryError(f"Unexpected API error: {str(e)}")
+        if response.status == 403:
+            # Re-scrape once (or pick up another entry's fresh scrape) and retry straight away
+            reauthenticated = True
+            await cloudflare.async_refresh(session, generation)
+            continue
+        # A 429; back off outside the concurrency slot so other fetches proceed
+        wait_time = 2 ** attempt
+        _LOGGER.warning(f"Rate limit hit for fuel type {fuel_type}, retrying after {wait_time}s")
+        await asyncio.sleep(wait_time)
+    return None
\ No newline at end of file
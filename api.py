@@ -0,0 +1,213 @@
+# api.py
+import logging
+import asyncio
+import time
+from collections import OrderedDict
+import aiohttp
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import HomeAssistant
+from .const import (
+    DOMAIN, HTTP_CONNECTION_LIMIT, HTTP_CONNECTION_LIMIT_PER_HOST, HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT, API_GUEST_HOURLY_LIMIT, API_RATE_LIMIT_BURST,
+    API_RATE_LIMIT_MAX_WAIT, MAX_CONCURRENT_FETCHES, COALESCE_RESULT_TTL,
+    RESPONSE_CACHE_SIZE
+)
+from .metrics import async_get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+def async_get_domain_data(hass: HomeAssistant) -> dict:
+    """Return hass.data[DOMAIN], initialising it on first use."""
+    if DOMAIN not in hass.data:
+        hass.data[DOMAIN] = {"last_data": {}}
+        _LOGGER.debug(f"Initialized hass.data[{DOMAIN}] with last_data")
+
+        async def _async_close_session(event):
+            await async_close_session(hass)
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _async_close_session)
+    return hass.data[DOMAIN]
+
+async def async_get_loaded(hass: HomeAssistant, key, factory):
+    """Return the shared object at hass.data[DOMAIN][key], creating and loading it on first use.
+
+    factory(hass) builds the object and its async_load() reads it from disk. A lock
+    per key makes concurrent first callers wait for one load instead of each
+    starting their own.
+    """
+    domain_data = hass.data[DOMAIN]
+    loaded = domain_data.get(key)
+    if loaded is not None:
+        return loaded
+    async with domain_data.setdefault("load_locks", {}).setdefault(key, asyncio.Lock()):
+        loaded = domain_data.get(key)
+        if loaded is None:
+            loaded = factory(hass)
+            await loaded.async_load()
+            domain_data[key] = loaded
+    return loaded
+
+def async_get_session(hass: HomeAssistant) -> aiohttp.ClientSession:
+    """Return the shared PetrolMap HTTP session, creating it on first use.
+
+    One session is kept per integration so every config entry and refresh reuses
+    the same keep-alive connections, DNS cache and cookie jar.
+    """
+    session = hass.data[DOMAIN].get("session")
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.CookieJar())
+        hass.data[DOMAIN]["session"] = session
+        _LOGGER.debug("Created shared PetrolMap HTTP session")
+    return session
+
+async def async_close_session(hass: HomeAssistant):
+    """Close the shared PetrolMap HTTP session if one is open."""
+    session = hass.data.get(DOMAIN, {}).pop("session", None)
+    if session is not None and not session.closed:
+        await session.close()
+        _LOGGER.debug("Closed shared PetrolMap HTTP session")
+
+class RateLimiter:
+    """Token bucket limiting PetrolPrices requests across all config entries."""
+
+    def __init__(self, hourly_limit, burst, max_concurrent):
+        self._capacity = burst
+        self._tokens = float(burst)
+        self._rate = hourly_limit / 3600
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.concurrency = asyncio.Semaphore(max_concurrent)
+
+    def set_hourly_limit(self, hourly_limit):
+        """Change the sustained request rate, keeping the tokens already accrued."""
+        self._refill()
+        self._rate = hourly_limit / 3600
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    @property
+    def available(self):
+        """Whole tokens that can be taken right now without waiting."""
+        self._refill()
+        return int(self._tokens)
+
+    async def async_acquire(self, max_wait=API_RATE_LIMIT_MAX_WAIT):
+        """Take one token, waiting up to max_wait seconds. Return False if quota is exhausted."""
+        deadline = time.monotonic() + max_wait
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                wait_time = (1 - self._tokens) / self._rate
+                if self._updated + wait_time > deadline:
+                    return False
+                _LOGGER.debug("Request quota exhausted, waiting %.0fs for a token", wait_time)
+                await asyncio.sleep(wait_time)
+                self._refill()
+            self._tokens -= 1
+            return True
+
+def async_get_rate_limiter(hass: HomeAssistant) -> RateLimiter:
+    """Return the PetrolPrices rate limiter shared by all config entries."""
+    limiter = hass.data[DOMAIN].get("rate_limiter")
+    if limiter is None:
+        limiter = RateLimiter(API_GUEST_HOURLY_LIMIT, API_RATE_LIMIT_BURST, MAX_CONCURRENT_FETCHES)
+        hass.data[DOMAIN]["rate_limiter"] = limiter
+    return limiter
+
+class SingleFlight:
+    """Deduplicate identical upstream requests made by different config entries.
+
+    Callers asking for a key that is already being fetched await the same task
+    instead of issuing a second request. Successful results are also kept for
+    COALESCE_RESULT_TTL seconds so entries refreshing just after each other share them.
+    """
+
+    def __init__(self, result_ttl=COALESCE_RESULT_TTL, metrics=None):
+        self._result_ttl = result_ttl
+        self._metrics = metrics
+        self._in_flight = {}
+        self._results = {}
+
+    async def async_do(self, key, factory):
+        """Return the result for key, running factory() only if nobody else is."""
+        cached = self._results.get(key)
+        if cached is not None:
+            fetched_at, result = cached
+            if time.monotonic() - fetched_at < self._result_ttl:
+                _LOGGER.debug("Reusing coalesced result for %s", key)
+                if self._metrics is not None:
+                    self._metrics.count("coalesced")
+                return result
+            del self._results[key]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._async_finished(key, done))
+        else:
+            _LOGGER.debug("Joining in-flight request for %s", key)
+            if self._metrics is not None:
+                self._metrics.count("coalesced")
+        return await asyncio.shield(task)
+
+    def _async_finished(self, key, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            now = time.monotonic()
+            # Drop expired results, including keys nobody will ask for again (moved or unloaded entries)
+            for expired in [
+                other for other, (fetched_at, _) in self._results.items() if now - fetched_at >= self._result_ttl
+            ]:
+                del self._results[expired]
+            self._results[key] = (now, task.result())
+
+def async_get_single_flight(hass: HomeAssistant) -> SingleFlight:
+    """Return the request coalescer shared by all config entries."""
+    flight = hass.data[DOMAIN].get("single_flight")
+    if flight is None:
+        flight = SingleFlight(metrics=async_get_metrics(hass))
+        hass.data[DOMAIN]["single_flight"] = flight
+    return flight
+
+class ResponseCache:
+    """Last decoded PetrolPrices response and its ETag, keyed by request.
+
+    Lets a refresh send If-None-Match and reuse the decoded body on a 304 instead
+    of downloading and decoding the same payload again. The least recently used
+    responses are dropped beyond RESPONSE_CACHE_SIZE.
+    """
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        self._max_size = max_size
+        self._responses = OrderedDict()
+
+    def get(self, key):
+        """Return (etag, data) for key, or None."""
+        cached = self._responses.get(key)
+        if cached is not None:
+            self._responses.move_to_end(key)
+        return cached
+
+    def set(self, key, etag, data):
+        self._responses[key] = (etag, data)
+        self._responses.move_to_end(key)
+        while len(self._responses) > self._max_size:
+            self._responses.popitem(last=False)
+
+def async_get_response_cache(hass: HomeAssistant) -> ResponseCache:
+    """Return the PetrolPrices response cache shared by all config entries."""
+    cache = hass.data[DOMAIN].get("response_cache")
+    if cache is None:
+        cache = ResponseCache()
+        hass.data[DOMAIN]["response_cache"] = cache
+    return cache
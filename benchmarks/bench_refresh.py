@@ -0,0 +1,274 @@
+# bench_refresh.py
+"""Replay refreshes against the local stub upstream and report their cost.
+
+Requires Home Assistant to be importable, as for the integration itself:
+
+    python benchmarks/bench_refresh.py --entries 1 10 50 --stations 100 1000 10000
+
+For each (entries, stations) combination every entry is set up the way
+async_setup_entry does it, then refreshed for --rounds rounds. The first round is
+cold (geocoding, feature lookups, full downloads); later rounds churn a share of
+prices first, so they exercise ETag revalidation and per-station deltas, and with
+--revoke-clearance they also invalidate the Cloudflare cookie to force a re-warm.
+--api-key switches the entries to paginated fetching. Each
+round reports wall time, upstream requests by endpoint, CPU time spent parsing,
+joining and updating entities, and peak Python memory (tracemalloc). The stub
+upstream runs in its own process, so neither its work nor its memory is counted.
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import timedelta
+from types import MappingProxyType
+
+from stub_server import StubProcess
+
+def _import_integration():
+    """Import the repository as custom_components.petrolmap without installing it."""
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    root = tempfile.mkdtemp(prefix="petrolmap-bench-")
+    os.makedirs(os.path.join(root, "custom_components"))
+    os.symlink(repo, os.path.join(root, "custom_components", "petrolmap"))
+    sys.path.insert(0, root)
+    import custom_components.petrolmap as petrolmap
+    return petrolmap
+
+petrolmap = _import_integration()
+from custom_components.petrolmap import api, cloudflare, features, geocode, sensor, spatial
+from custom_components.petrolmap.const import (
+    DOMAIN, CONF_POSTCODE, CONF_DISTANCE, CONF_API_KEY, CONF_HOURLY_BUDGET, MAX_CONCURRENT_FETCHES
+)
+from custom_components.petrolmap.coordinator import PetrolMapCoordinator
+from custom_components.petrolmap.scheduler import RefreshScheduler
+from homeassistant.config_entries import ConfigEntries, ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr, entity, entity_registry as er, translation
+from homeassistant.helpers.entity_platform import EntityPlatform
+
+_UNLIMITED = 10 ** 9
+# ConfigEntry arguments that later Home Assistant releases made required (2024.9+, 2025.x)
+_ENTRY_DEFAULTS = {"unique_id": None, "discovery_keys": MappingProxyType({}), "subentries_data": None}
+
+class CpuProfile:
+    """Accumulates thread CPU time of selected synchronous functions into buckets."""
+
+    def __init__(self):
+        self.buckets = Counter()
+        self._patched = []
+
+    def wrap(self, owner, name, bucket):
+        original = getattr(owner, name)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.buckets[bucket] += time.thread_time() - start
+
+        setattr(owner, name, timed)
+        self._patched.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched.clear()
+
+def _install_profile():
+    profile = CpuProfile()
+    profile.wrap(petrolmap, "parse_feature_collection", "parse")
+    profile.wrap(petrolmap, "carry_forward_prices", "join")
+    profile.wrap(features.PetrolMapIndex, "__init__", "join")
+    profile.wrap(features.PetrolMapIndex, "match", "join")
+    profile.wrap(spatial.StationIndex, "async_update", "join")
+    profile.wrap(spatial.StationIndex, "within_radius", "join")
+    profile.wrap(PetrolMapCoordinator, "_async_compute_delta", "delta")
+    profile.wrap(sensor.PetrolMapSensor, "_handle_coordinator_update", "entities")
+    profile.wrap(sensor.PetrolMapStationSensor, "_handle_coordinator_update", "entities")
+    profile.wrap(sensor.PetrolMapCheapestSensor, "_handle_coordinator_update", "entities")
+    return profile
+
+def _point_at(stub):
+    base = stub.base_url
+    petrolmap.PETROL_PRICES_API_BASE_URL = (
+        base + "/app/geojson/{fuel_type}/{brand_type}/{result_limit}/{offset}/{sort_type}/{radius}?lat={lat}&lng={lng}"
+    )
+    cloudflare.PETROL_PRICES_HOME_URL = base + "/"
+    features.PETROLMAP_API_URL = base + "/data/stations-guest"
+    geocode.GEOCODE_API_URL = base + "/search"
+
+async def _async_setup_hass(config_dir):
+    hass = HomeAssistant(config_dir)
+    hass.config.latitude, hass.config.longitude = 54.45, -6.0
+    # Set up by the core bootstrap since 2024.3; earlier releases have no such helpers
+    if hasattr(entity, "async_setup"):
+        entity.async_setup(hass)
+    if hasattr(translation, "async_setup"):
+        translation.async_setup(hass)
+    hass.config_entries = ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+    await dr.async_load(hass)
+    await er.async_load(hass)
+    domain_data = api.async_get_domain_data(hass)
+    # Quota is not what is being measured
+    domain_data["rate_limiter"] = api.RateLimiter(_UNLIMITED, _UNLIMITED, MAX_CONCURRENT_FETCHES)
+    return hass
+
+def _make_entry(index, postcode, distance, api_key):
+    parameters = inspect.signature(ConfigEntry).parameters
+    return ConfigEntry(
+        version=1,
+        minor_version=1,
+        domain=DOMAIN,
+        title=f"PetrolMap {postcode}",
+        data={CONF_POSTCODE: postcode, CONF_DISTANCE: distance, CONF_API_KEY: api_key},
+        options={CONF_HOURLY_BUDGET: _UNLIMITED},
+        source="user",
+        entry_id=f"bench{index:04d}",
+        **{name: value for name, value in _ENTRY_DEFAULTS.items() if name in parameters},
+    )
+
+def _platform_adder(hass, platform, tasks):
+    """Return an async_add_entities callback that adds to platform, collecting the tasks in tasks."""
+    def add(new_entities, update_before_add=False):
+        tasks.append(hass.async_create_task(platform.async_add_entities(new_entities, update_before_add)))
+    return add
+
+async def _async_run_scenario(args, entries, stations):
+    stub = StubProcess(
+        stations=stations, spread=args.spread, latency=args.latency / 1000,
+        rate_429=args.rate_429, rate_limit_exceed=args.limit_exceed, seed=args.seed,
+    )
+    await stub.async_start()
+    _point_at(stub)
+    config_dir = tempfile.mkdtemp(prefix="petrolmap-bench-config-")
+    hass = await _async_setup_hass(config_dir)
+    await petrolmap.async_get_price_history(hass)
+
+    coordinators, platforms = [], []
+    for index in range(entries):
+        postcode = f"BT{index + 1} {index % 9 + 1}AA"
+        await stub.async_add_location(postcode, *await stub.async_random_location())
+        entry = _make_entry(index, postcode, args.radius, args.api_key)
+        # Registered without setting it up, so station devices can link to it
+        hass.config_entries._entries[entry.entry_id] = entry
+        scheduler = RefreshScheduler(entry.entry_id, _UNLIMITED)
+        coordinator = PetrolMapCoordinator(
+            hass, functools.partial(petrolmap.async_update_data, hass, entry, scheduler), scheduler
+        )
+        hass.data[DOMAIN][entry.entry_id] = coordinator
+        platform = EntityPlatform(
+            hass=hass, logger=logging.getLogger(__name__), domain="sensor", platform_name=DOMAIN,
+            platform=None, scan_interval=timedelta(seconds=30), entity_namespace=None,
+        )
+        platform.config_entry = entry
+        coordinators.append((entry, coordinator))
+        platforms.append(platform)
+
+    profile = _install_profile()
+    rounds = []
+    adding = []
+    try:
+        for round_number in range(args.rounds):
+            if round_number:
+                await stub.async_churn(args.churn)
+                if args.revoke_clearance:
+                    await stub.async_revoke_clearance()
+                # Let every entry hit upstream again rather than a coalesced result from the previous round
+                hass.data[DOMAIN].pop("single_flight", None)
+            profile.buckets.clear()
+            requests_before = await stub.async_counts()
+            tracemalloc.reset_peak()
+            started = time.perf_counter()
+            await asyncio.gather(*(coordinator.async_refresh() for _, coordinator in coordinators))
+            start = time.thread_time()
+            if round_number == 0:
+                for (entry, coordinator), platform in zip(coordinators, platforms):
+                    await sensor.async_setup_entry(hass, entry, _platform_adder(hass, platform, adding))
+            # Initial entities, and in later rounds those the platform adds for new station prices
+            await asyncio.gather(*adding)
+            adding.clear()
+            profile.buckets["entities"] += time.thread_time() - start
+            await hass.async_block_till_done()
+            wall = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            requests = await stub.async_counts()
+            requests.subtract(requests_before)
+            rounds.append({
+                "entries": entries,
+                "stations": stations,
+                "round": round_number,
+                "wall_s": round(wall, 4),
+                "requests": {key: value for key, value in requests.items() if value},
+                "cpu_s": {key: round(value, 4) for key, value in profile.buckets.items()},
+                "peak_mb": round(peak / 2 ** 20, 2),
+                "entities": len(hass.states.async_all("sensor")),
+                "stations_per_entry": round(
+                    sum(len((coordinator.data or {}).get("stations") or {}) for _, coordinator in coordinators) / entries, 1
+                ),
+            })
+    finally:
+        profile.restore()
+        for _, coordinator in coordinators:
+            await coordinator.async_shutdown()
+        await api.async_close_session(hass)
+        await hass.async_stop(force=True)
+        await stub.async_stop()
+    return rounds
+
+def _print_round(result):
+    requests = ", ".join(f"{key}={value}" for key, value in sorted(result["requests"].items()))
+    cpu = ", ".join(f"{key}={value * 1000:.1f}ms" for key, value in sorted(result["cpu_s"].items()))
+    print(
+        f"entries={result['entries']:<3} stations={result['stations']:<6} round={result['round']} "
+        f"wall={result['wall_s'] * 1000:.0f}ms peak={result['peak_mb']}MB entities={result['entities']} "
+        f"per_entry={result['stations_per_entry']} | {requests} | {cpu}"
+    )
+
+async def _async_main(args):
+    tracemalloc.start()
+    results = []
+    for entries in args.entries:
+        for stations in args.stations:
+            for result in await _async_run_scenario(args, entries, stations):
+                _print_round(result)
+                results.append(result)
+    tracemalloc.stop()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--stations", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--rounds", type=int, default=2, help="refreshes per scenario, the first one cold")
+    parser.add_argument("--radius", type=int, default=10, help="search radius of every entry in miles")
+    parser.add_argument("--api-key", default="", help="give every entry an API key, so prices are fetched in pages")
+    parser.add_argument("--spread", type=float, default=20, help="half-width of the station universe in miles")
+    parser.add_argument("--churn", type=float, default=0.05, help="share of stations repriced between rounds")
+    parser.add_argument("--latency", type=float, default=20, help="upstream latency in milliseconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="probability of a 429 per PetrolPrices request")
+    parser.add_argument("--limit-exceed", type=float, default=0.0, help="probability of a limitExceed payload")
+    parser.add_argument(
+        "--revoke-clearance", action="store_true", help="invalidate the Cloudflare cookie between rounds"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show integration logging")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.ERROR)
+    asyncio.run(_async_main(args))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,363 @@
+# stub_server.py
+"""Local stand-in for the PetrolPrices, PetrolMap and Nominatim endpoints.
+
+Serves a synthetic universe of stations built from the captured responses in
+"Contruction files/type{1,2,4,5}.json", so refreshes can be replayed offline at
+any scale. Latency, 429 responses and limitExceed payloads are configurable. The
+homepage hands out a cf_clearance cookie that PetrolPrices requests must carry,
+and revoke_clearance() invalidates it to exercise 403 re-warming.
+
+Run as a script it serves in its own process, printing its base URL, so the
+benchmark's timings and memory peaks only include the integration. StubProcess
+starts it that way and drives it through the /_stub control routes.
+"""
+import argparse
+import asyncio
+import copy
+import hashlib
+import json
+import math
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from aiohttp import ClientSession, web
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "Contruction files"
+FUEL_TYPES = (1, 2, 4, 5)
+FUEL_OFFSETS = {1: 110, 2: 0, 4: 130, 5: 40}  # Tenths of a penny over the station's unleaded price
+FEATURES = ("Car Wash", "Shop", "ATM", "Toilets", "Air & Water", "Jet Wash", "EV Charging", "Cafe")
+MILES_PER_DEGREE = 69.09
+
+def _haversine_miles(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * 3958.8 * math.asin(math.sqrt(a))
+
+def load_templates():
+    """Return the captured feature properties of every station, keyed by station id."""
+    templates = {}
+    for fuel_type in FUEL_TYPES:
+        with open(FIXTURES_DIR / f"type{fuel_type}.json", encoding="utf-8") as file:
+            data = json.load(file)
+        for feature in data["data"]["features"]:
+            templates.setdefault(feature["properties"]["idstation"], feature)
+    return list(templates.values())
+
+class StubUpstream:
+    """aiohttp application emulating every upstream API used by a refresh."""
+
+    def __init__(self, stations=1000, center=(54.45, -6.0), spread=20, latency=0.0,
+                 rate_429=0.0, rate_limit_exceed=0.0, clearance_ttl=1800, seed=0):
+        self.latency = latency
+        self.clearance_ttl = clearance_ttl
+        self.rate_429 = rate_429
+        self.rate_limit_exceed = rate_limit_exceed
+        self.counts = Counter()
+        self._random = random.Random(seed)
+        self._center = center
+        self._spread = spread
+        self._locations = {}
+        self._version = 0
+        self._responses = {}
+        self._clearance = None
+        self._runner = None
+        self.base_url = None
+        self._build_universe(stations)
+
+    def _build_universe(self, count):
+        templates = load_templates()
+        now = datetime.now(timezone.utc)
+        lat0, lng0 = self._center
+        lat_span = self._spread / MILES_PER_DEGREE
+        lng_span = self._spread / (MILES_PER_DEGREE * math.cos(math.radians(lat0)))
+        self.stations = []
+        for index in range(count):
+            template = templates[index % len(templates)]
+            # Unique per station, like real ones, so the postcode-first feature join matches as it would live
+            letters = index // 10 % 676
+            postcode = f"SB{index // 6760 + 1} {index % 10}{chr(65 + letters // 26)}{chr(65 + letters % 26)}"
+            base_price = self._random.randint(1240, 1420)
+            prices = {
+                fuel_type: base_price + offset for fuel_type, offset in FUEL_OFFSETS.items()
+                if fuel_type in (2, 5) or self._random.random() < 0.6
+            }
+            self.stations.append({
+                "id": 100000 + index,
+                "lat": lat0 + self._random.uniform(-lat_span, lat_span),
+                "lng": lng0 + self._random.uniform(-lng_span, lng_span),
+                "template": template["properties"],
+                "postcode": postcode,
+                "prices": prices,
+                "recorded": {
+                    fuel_type: (now - timedelta(hours=self._random.randint(1, 96))).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                    for fuel_type in prices
+                },
+                "features": self._random.sample(FEATURES, self._random.randint(0, 4)),
+            })
+
+    def add_location(self, postcode, lat, lng):
+        """Make the geocoder and PetrolMap stubs resolve postcode to (lat, lng)."""
+        self._locations[postcode.replace(" ", "").upper()] = (lat, lng)
+
+    def random_location(self):
+        """Return a point inside the station universe."""
+        lat0, lng0 = self._center
+        radius = self._spread * 0.8
+        return (
+            lat0 + self._random.uniform(-radius, radius) / MILES_PER_DEGREE,
+            lng0 + self._random.uniform(-radius, radius) / (MILES_PER_DEGREE * math.cos(math.radians(lat0))),
+        )
+
+    def churn(self, fraction):
+        """Move the prices of a fraction of stations, as a refresh interval's worth of updates.
+
+        One in ten of them also starts selling a fuel it did not, so refreshes add sensors.
+        """
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        for station in self._random.sample(self.stations, int(len(self.stations) * fraction)):
+            delta = self._random.choice((-20, -10, 10, 20))
+            missing = [fuel_type for fuel_type in FUEL_TYPES if fuel_type not in station["prices"]]
+            if missing and self._random.random() < 0.1:
+                fuel_type = self._random.choice(missing)
+                station["prices"][fuel_type] = station["prices"][2] + FUEL_OFFSETS[fuel_type]
+            for fuel_type in station["prices"]:
+                station["prices"][fuel_type] += delta
+                station["recorded"][fuel_type] = now
+        self._version += 1
+        self._responses.clear()
+
+    def _within(self, lat, lng, radius):
+        for station in self.stations:
+            distance = _haversine_miles(lat, lng, station["lat"], station["lng"])
+            if distance <= radius:
+                yield distance, station
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def revoke_clearance(self):
+        """Make the issued cf_clearance cookie stale, as Cloudflare does when it rotates."""
+        self._clearance = None
+
+    async def _handle_homepage(self, request):
+        self.counts["homepage"] += 1
+        await self._delay()
+        self._clearance = f"stub{self._random.getrandbits(64):016x}"
+        token = f"{self._random.getrandbits(64):016x}"
+        response = web.Response(
+            text=f'<html><head><script>window.config = {{"cf-token":"{token}"}};</script></head><body></body></html>',
+            content_type="text/html",
+        )
+        response.set_cookie("cf_clearance", self._clearance, max_age=self.clearance_ttl)
+        return response
+
+    async def _handle_geojson(self, request):
+        self.counts["petrolprices"] += 1
+        await self._delay()
+        if self._clearance is None or request.cookies.get("cf_clearance") != self._clearance:
+            self.counts["petrolprices_403"] += 1
+            return web.Response(status=403, text="Forbidden")
+        if self._random.random() < self.rate_429:
+            self.counts["petrolprices_429"] += 1
+            return web.Response(status=429, text="Too Many Requests")
+        info = request.match_info
+        fuel_type, limit, offset = int(info["fuel_type"]), int(info["result_limit"]), int(info["offset"])
+        radius = float(info["radius"])
+        lat, lng = float(request.query["lat"]), float(request.query["lng"])
+        limit_exceed = self._random.random() < self.rate_limit_exceed
+        key = (fuel_type, limit, offset, info["sort_type"], radius, lat, lng, limit_exceed, self._version)
+        cached = self._responses.get(key)
+        if cached is None:
+            cached = self._responses[key] = self._render_geojson(key)
+        body, etag = cached
+        if limit_exceed:
+            self.counts["petrolprices_limit_exceed"] += 1
+        if request.headers.get("If-None-Match") == etag:
+            self.counts["petrolprices_304"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    def _render_geojson(self, key):
+        fuel_type, limit, offset, sort_type, radius, lat, lng, limit_exceed, _ = key
+        matches = [(distance, station) for distance, station in self._within(lat, lng, radius) if fuel_type in station["prices"]]
+        if sort_type == "distance":
+            matches.sort(key=lambda match: match[0])
+        else:
+            matches.sort(key=lambda match: (match[1]["prices"][fuel_type], match[0]))
+        matches = matches[offset:offset + limit] if limit else matches[offset:]
+        features = []
+        for distance, station in matches:
+            properties = copy.copy(station["template"])
+            properties.update(
+                idstation=station["id"],
+                postcode=station["postcode"],
+                fuel_type=fuel_type,
+                price=station["prices"][fuel_type],
+                recorded_time=station["recorded"][fuel_type],
+                distance_in_miles_from_given_coords=round(distance, 1),
+            )
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [station["lng"], station["lat"]]},
+                "properties": properties,
+            })
+        payload = {
+            "error": False,
+            "limitExceed": limit_exceed,
+            "data": {"type": "FeatureCollection", "features": features},
+        }
+        body = json.dumps(payload).encode()
+        return body, f'W/"{hashlib.sha1(body).hexdigest()[:27]}"'
+
+    async def _handle_geocode(self, request):
+        self.counts["geocode"] += 1
+        await self._delay()
+        location = self._locations.get(request.query.get("q", "").replace(" ", "").upper())
+        if location is None:
+            return web.json_response([])
+        return web.json_response([{"lat": str(location[0]), "lon": str(location[1])}])
+
+    async def _handle_petrolmap(self, request):
+        self.counts["petrolmap"] += 1
+        await self._delay()
+        location = self._locations.get(request.query.get("address", "").replace(" ", "").upper())
+        if location is None:
+            return web.json_response({"data": []})
+        radius = float(request.query.get("distance", 5))
+        return web.json_response({"data": [
+            {
+                "Postcode": station["postcode"],
+                "Latitude": station["lat"],
+                "Longitude": station["lng"],
+                "Features": station["features"],
+            }
+            for _, station in self._within(location[0], location[1], radius)
+        ]})
+
+    async def _handle_control(self, request):
+        """Serve the /_stub routes StubProcess uses to drive a stub in another process."""
+        action = request.match_info["action"]
+        body = await request.json() if request.can_read_body else {}
+        if action == "location":
+            self.add_location(body["postcode"], body["lat"], body["lng"])
+        elif action == "random_location":
+            return web.json_response(self.random_location())
+        elif action == "churn":
+            self.churn(body["fraction"])
+        elif action == "revoke_clearance":
+            self.revoke_clearance()
+        elif action == "counts":
+            return web.json_response(self.counts)
+        else:
+            raise web.HTTPNotFound()
+        return web.json_response({})
+
+    async def async_start(self, port=0):
+        """Serve on a localhost port, ephemeral by default, and set base_url."""
+        app = web.Application()
+        app.router.add_get(
+            "/app/geojson/{fuel_type}/{brand_type}/{result_limit}/{offset}/{sort_type}/{radius}", self._handle_geojson
+        )
+        app.router.add_get("/", self._handle_homepage)
+        app.router.add_get("/search", self._handle_geocode)
+        app.router.add_get("/data/stations-guest", self._handle_petrolmap)
+        app.router.add_post("/_stub/{action}", self._handle_control)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def async_stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+class StubProcess:
+    """Runs StubUpstream in a child process and mirrors its control methods."""
+
+    def __init__(self, **options):
+        self._options = options
+        self._process = None
+        self._session = None
+        self.base_url = None
+
+    async def async_start(self):
+        """Start the child process and wait until it serves."""
+        args = [f"--{name.replace('_', '-')}={value}" for name, value in self._options.items()]
+        self._process = await asyncio.create_subprocess_exec(
+            sys.executable, str(Path(__file__).resolve()), *args, stdout=asyncio.subprocess.PIPE
+        )
+        line = await self._process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Stub upstream exited with code {await self._process.wait()}")
+        self.base_url = line.decode().strip()
+        self._session = ClientSession()
+        return self.base_url
+
+    async def _async_control(self, action, **body):
+        async with self._session.post(f"{self.base_url}/_stub/{action}", json=body) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def async_add_location(self, postcode, lat, lng):
+        await self._async_control("location", postcode=postcode, lat=lat, lng=lng)
+
+    async def async_random_location(self):
+        return tuple(await self._async_control("random_location"))
+
+    async def async_churn(self, fraction):
+        await self._async_control("churn", fraction=fraction)
+
+    async def async_revoke_clearance(self):
+        await self._async_control("revoke_clearance")
+
+    async def async_counts(self):
+        """Return the upstream requests served so far, by endpoint."""
+        return Counter(await self._async_control("counts"))
+
+    async def async_stop(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._process is not None:
+            self._process.terminate()
+            await self._process.wait()
+            self._process = None
+
+async def _async_serve(args):
+    stub = StubUpstream(
+        stations=args.stations, spread=args.spread, latency=args.latency,
+        rate_429=args.rate_429, rate_limit_exceed=args.rate_limit_exceed, seed=args.seed,
+    )
+    print(await stub.async_start(args.port), flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.async_stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the stub upstream until terminated.")
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--spread", type=float, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-limit-exceed", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_async_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
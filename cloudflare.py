@@ -0,0 +1,140 @@
+# cloudflare.py
+import logging
+import asyncio
+import re
+import time
+from email.utils import parsedate_to_datetime
+import async_timeout
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import (
+    PETROL_PRICES_HOME_URL, API_TIMEOUT, STORAGE_VERSION, STORAGE_SAVE_DELAY, CLOUDFLARE_STORAGE_KEY,
+    CLOUDFLARE_DEFAULT_TTL, CLOUDFLARE_REFRESH_MARGIN, CLOUDFLARE_RETRY_DELAY, CLOUDFLARE_SCAN_LIMIT
+)
+from .api import async_get_loaded
+from .metrics import async_get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(rb'"cf-token":"([^"]+)"')
+_DEFAULT_TOKEN = "default_token"
+_HOMEPAGE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36",
+    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "accept-encoding": "gzip, deflate, br",
+    "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
+}
+
+def _cookie_expiry(morsel, now):
+    """Return when a Set-Cookie morsel expires (epoch seconds), or None for session cookies."""
+    max_age = morsel.get("max-age")
+    if max_age:
+        try:
+            return now + int(max_age)
+        except ValueError:
+            pass
+    expires = morsel.get("expires")
+    if expires:
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return None
+
+class CloudflareSession:
+    """Cloudflare cookies and cf-token used for PetrolPrices requests.
+
+    Persisted with their expiry so restarts reuse them, and re-scraped from the
+    homepage shortly before they expire or when PetrolPrices answers 403. Refreshes
+    are serialised, so entries that need one at the same time share a single scrape.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, CLOUDFLARE_STORAGE_KEY)
+        self._lock = asyncio.Lock()
+        self.cookies = {}
+        self.token = None
+        self.expires = 0.0
+        self.generation = 0  # Bumped on every scrape attempt, so waiters can tell one happened
+        self._retry_after = 0.0
+
+    async def async_load(self):
+        stored = await self._store.async_load() or {}
+        if stored.get("expires", 0) > time.time():
+            self.cookies = stored.get("cookies", {})
+            self.token = stored.get("token")
+            self.expires = stored["expires"]
+            _LOGGER.debug("Restored Cloudflare session valid for another %.0fs", self.expires - time.time())
+
+    @property
+    def headers(self):
+        """Extra request headers carrying the cf-token."""
+        return {"cf-token": self.token} if self.token else {}
+
+    def _needs_refresh(self, now):
+        return now >= self.expires - CLOUDFLARE_REFRESH_MARGIN and now >= self._retry_after
+
+    async def async_ensure(self, session):
+        """Refresh the session if it has expired or is about to."""
+        if self._needs_refresh(time.time()):
+            generation = self.generation
+            async with self._lock:
+                if self.generation == generation and self._needs_refresh(time.time()):
+                    await self._async_scrape(session)
+
+    async def async_refresh(self, session, generation):
+        """Re-scrape after a 403, unless another caller already did since generation was read."""
+        async with self._lock:
+            if self.generation == generation:
+                await self._async_scrape(session)
+
+    async def _async_scrape(self, session):
+        self.generation += 1
+        async_get_metrics(self._hass).count("cloudflare_refreshes")
+        now = time.time()
+        try:
+            async with async_timeout.timeout(API_TIMEOUT):
+                async with session.get(PETROL_PRICES_HOME_URL, headers=_HOMEPAGE_HEADERS) as response:
+                    if response.status != 200:
+                        _LOGGER.warning(f"Failed to scrape Cloudflare cookies: status {response.status}")
+                        self._retry_after = now + CLOUDFLARE_RETRY_DELAY
+                        return
+                    cookies = {key: morsel.value for key, morsel in response.cookies.items()}
+                    expiries = [
+                        expiry for expiry in (_cookie_expiry(morsel, now) for morsel in response.cookies.values())
+                        if expiry is not None
+                    ]
+                    # Only read as much of the page as it takes to find the token
+                    token, scanned, read = None, b"", 0
+                    async for chunk in response.content.iter_chunked(16384):
+                        read += len(chunk)
+                        scanned = scanned[-256:] + chunk  # Keep a tail so a token split across chunks still matches
+                        match = _TOKEN_PATTERN.search(scanned)
+                        if match:
+                            token = match.group(1).decode()
+                            break
+                        if read >= CLOUDFLARE_SCAN_LIMIT:
+                            break
+        except Exception as e:
+            _LOGGER.warning(f"Failed to scrape Cloudflare cookies: {str(e)}")
+            self.token = self.token or _DEFAULT_TOKEN
+            self._retry_after = now + CLOUDFLARE_RETRY_DELAY
+            return
+
+        self.cookies = cookies or self.cookies
+        self.token = token or _DEFAULT_TOKEN
+        self.expires = min(expiries, default=now + CLOUDFLARE_DEFAULT_TTL)
+        self._retry_after = 0.0
+        _LOGGER.debug(
+            "Scraped Cloudflare cookies %s, token %s, valid for %.0fs",
+            list(self.cookies), "found" if token else "not found", self.expires - now,
+        )
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    def _data_to_save(self):
+        return {"cookies": self.cookies, "token": self.token, "expires": self.expires}
+
+async def async_get_cloudflare_session(hass: HomeAssistant) -> CloudflareSession:
+    """Return the Cloudflare session shared by all config entries, loading it on first use."""
+    return await async_get_loaded(hass, "cloudflare", CloudflareSession)
\ No newline at end of file
@@ -4,13 +4,28 @@ import logging
 import re
 from homeassistant import config_entries
 from homeassistant.core import callback
-from .const import DOMAIN, CONF_POSTCODE, CONF_DISTANCE, CONF_API_KEY, DEFAULT_DISTANCE
+from .const import (
+    DOMAIN, CONF_POSTCODE, CONF_DISTANCE, CONF_API_KEY, CONF_STATION_SENSORS, CONF_TOP_N,
+    CONF_CHEAPEST_RADIUS, CONF_HOURLY_BUDGET, CONF_DIAGNOSTIC_SENSORS, API_GUEST_HOURLY_LIMIT, DEFAULT_DISTANCE,
+    DEFAULT_STATION_SENSORS, DEFAULT_TOP_N, DEFAULT_CHEAPEST_RADIUS, DEFAULT_DIAGNOSTIC_SENSORS
+)
+from .coordinator import get_entry_config
+from .api import async_get_domain_data, async_get_session
+from .geocode import async_geocode_postcode
 
 _LOGGER = logging.getLogger(__name__)
 
 # UK postcode format regex (simplified for common formats)
 POSTCODE_REGEX = r'^[A-Z]{1,2}[0-9][0-9A-Z]?\s?[0-9][A-Z]{2}$'
 
+async def _async_warm_geocode_cache(hass, postcode):
+    """Geocode a new postcode up front so the first refresh finds it cached."""
+    async_get_domain_data(hass)
+    try:
+        await async_geocode_postcode(hass, async_get_session(hass), postcode)
+    except Exception as e:
+        _LOGGER.debug(f"Could not warm geocode cache for {postcode}: {str(e)}")
+
 class PetrolMapConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for PetrolMap."""
     VERSION = 1
@@ -23,6 +38,10 @@ class PetrolMapConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             if not re.match(POSTCODE_REGEX, postcode):
                 errors["base"] = "invalid_postcode"
             else:
+                # Not awaited: the form shouldn't wait on the geocoders and their retries
+                self.hass.async_create_background_task(
+                    _async_warm_geocode_cache(self.hass, postcode), f"{DOMAIN} geocode {postcode}"
+                )
                 return self.async_create_entry(
                     title=f"PetrolMap {postcode}",
                     data={
@@ -63,7 +82,7 @@ class PetrolMapOptionsFlow(config_entries.OptionsFlow):
                     data_schema=self._get_schema(),
                     errors={"base": "invalid_postcode"}
                 )
-            return self.async_create_entry(title="", data=user_input)
+            return self.async_create_entry(title="", data={**user_input, CONF_POSTCODE: postcode})
 
         return self.async_show_form(
             step_id="init",
@@ -72,8 +91,14 @@ class PetrolMapOptionsFlow(config_entries.OptionsFlow):
 
     def _get_schema(self):
         """Return the schema for the options flow."""
+        config = get_entry_config(self.config_entry)
         return vol.Schema({
-            vol.Required(CONF_POSTCODE, default=self.config_entry.data.get(CONF_POSTCODE, "")): str,
-            vol.Required(CONF_DISTANCE, default=self.config_entry.data.get(CONF_DISTANCE, DEFAULT_DISTANCE)): int,
-            vol.Optional(CONF_API_KEY, default=self.config_entry.data.get(CONF_API_KEY, "")): str,
+            vol.Required(CONF_POSTCODE, default=config.get(CONF_POSTCODE, "")): str,
+            vol.Required(CONF_DISTANCE, default=config.get(CONF_DISTANCE, DEFAULT_DISTANCE)): int,
+            vol.Optional(CONF_API_KEY, default=config.get(CONF_API_KEY, "")): str,
+            vol.Required(CONF_STATION_SENSORS, default=config.get(CONF_STATION_SENSORS, DEFAULT_STATION_SENSORS)): bool,
+            vol.Required(CONF_TOP_N, default=config.get(CONF_TOP_N, DEFAULT_TOP_N)): vol.All(int, vol.Range(min=1, max=20)),
+            vol.Required(CONF_CHEAPEST_RADIUS, default=config.get(CONF_CHEAPEST_RADIUS, DEFAULT_CHEAPEST_RADIUS)): vol.All(int, vol.Range(min=0)),
+            vol.Required(CONF_HOURLY_BUDGET, default=config.get(CONF_HOURLY_BUDGET, API_GUEST_HOURLY_LIMIT)): vol.All(int, vol.Range(min=1)),
+            vol.Required(CONF_DIAGNOSTIC_SENSORS, default=config.get(CONF_DIAGNOSTIC_SENSORS, DEFAULT_DIAGNOSTIC_SENSORS)): bool,
         })
\ No newline at end of file
@@ -6,7 +6,16 @@ DOMAIN = "petrolmap"
 CONF_POSTCODE = "postcode"
 CONF_DISTANCE = "distance"
 CONF_API_KEY = "api_key"
+CONF_STATION_SENSORS = "station_sensors"
+CONF_TOP_N = "top_n"
+CONF_CHEAPEST_RADIUS = "cheapest_radius"
+CONF_HOURLY_BUDGET = "hourly_budget"
+CONF_DIAGNOSTIC_SENSORS = "diagnostic_sensors"
 DEFAULT_DISTANCE = 5
+DEFAULT_STATION_SENSORS = True  # One sensor per station and fuel type
+DEFAULT_TOP_N = 5  # Stations listed on each cheapest-fuel sensor
+DEFAULT_CHEAPEST_RADIUS = 2  # Miles for the cheapest-nearby sensors, 0 disables them
+DEFAULT_DIAGNOSTIC_SENSORS = False  # Refresh timing and request counter sensors
 
 # Fuel type mappings for PetrolPrices.com API
 FUEL_TYPE_NAMES = {
@@ -34,8 +43,13 @@ DEFAULT_BRAND_TYPE = 0  # All brands
 DEFAULT_RESULT_LIMIT = 0  # Default for guest users (no limit or API default)
 DEFAULT_OFFSET = 0  # Default for guest users (no offset)
 DEFAULT_SORT_TYPE = "price"  # Sort by price (cheapest first, alternate is distance - nearest first)
+PAGE_SIZE = 100  # Stations per page when an API key allows result_limit/offset paging
+PAGE_WINDOW = 4  # Pages of one fuel type requested at once, still bounded by MAX_CONCURRENT_FETCHES
+MAX_PAGES = 50  # Stop paging a fuel type after this many pages
+PAGE_MIN_STATIONS = 1000  # Only queries that returned at least this many stations are worth paging
 
 # API URLs
+PETROL_PRICES_HOME_URL = "https://www.petrolprices.com"  # Scraped for Cloudflare cookies and the cf-token
 PETROLMAP_API_URL = "https://petrolmap.co.uk/data/stations-guest"
 GEOCODE_API_URL = "https://nominatim.openstreetmap.org/search"
 
@@ -43,7 +57,71 @@ GEOCODE_API_URL = "https://nominatim.openstreetmap.org/search"
 API_TIMEOUT = 10
 PRICE_AGE_LIMIT_DAYS = 7
 PLATFORMS = ["sensor"]
-UPDATE_INTERVAL = timedelta(hours=6)
+SIGNAL_METRICS_UPDATED = f"{DOMAIN}_metrics_updated"  # Sent after every refresh, for the integration-wide sensors
+UPDATE_INTERVAL = timedelta(hours=6)  # Full refresh interval until an area's change rate is known
+
+# Adaptive refresh scheduling, see scheduler.py
+SCHEDULER_MIN_INTERVAL = timedelta(hours=1)  # Busiest areas refresh at most this often
+SCHEDULER_MAX_INTERVAL = timedelta(hours=12)  # Quietest areas refresh at least this often
+SCHEDULER_TARGET_CHANGES = 5  # Price changes a refresh should typically pick up
+SCHEDULER_RATE_SMOOTHING = 0.3  # Weight of the newest observation in the change rate average
+SCHEDULER_JITTER = 0.1  # +/- fraction applied to every interval so entries drift apart
+SCHEDULER_STARTUP_WINDOW = 300  # Seconds over which entries restored from a snapshot are staggered
+SCHEDULER_STARTUP_CELL = 0.5  # Degrees; restored entries in one cell share a startup slot so they can coalesce
+SCHEDULER_RETRY_BASE = timedelta(minutes=15)  # First retry of a fuel type hit by limitExceed or 429
+SCHEDULER_RETRY_MAX = timedelta(hours=2)  # Longest retry backoff for a fuel type
+SCHEDULER_DUE_TOLERANCE = 5  # Seconds early a timer may fire and still count as on time
+STATION_RETIRE_AFTER = timedelta(days=7)  # How long a station or price may be missing before its entities are removed
+
+# Shared HTTP client settings
+HTTP_CONNECTION_LIMIT = 20  # Total open connections across all hosts
+HTTP_CONNECTION_LIMIT_PER_HOST = 4  # Concurrent connections to any single API host
+HTTP_DNS_CACHE_TTL = 3600  # Seconds to cache DNS lookups
+HTTP_KEEPALIVE_TIMEOUT = 60  # Seconds to keep idle connections open for reuse
+
+# PetrolPrices.com request budget, shared by every config entry (see API_GUEST_LIMIT_NOTE)
+API_GUEST_HOURLY_LIMIT = 20  # Conservative estimate of the guest hourly view limit
+API_RATE_LIMIT_BURST = 4  # Requests allowed back-to-back, enough for one refresh of all fuel types
+API_RATE_LIMIT_MAX_WAIT = 300  # Seconds a fetch may queue for quota before it is skipped
+API_FIRST_REFRESH_MAX_WAIT = 10  # Seconds a fetch during entry setup may queue for quota
+MAX_CONCURRENT_FETCHES = 4  # PetrolPrices requests in flight at once across all entries
+
+# Update pipeline metrics, see metrics.py
+METRICS_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Histogram upper bounds in seconds
+
+# Cloudflare session, see cloudflare.py (seconds)
+CLOUDFLARE_DEFAULT_TTL = 1800  # Assumed lifetime when no cookie states an expiry
+CLOUDFLARE_REFRESH_MARGIN = 300  # Re-scrape this long before the session expires
+CLOUDFLARE_RETRY_DELAY = 300  # Wait after a failed scrape before trying again
+CLOUDFLARE_SCAN_LIMIT = 512 * 1024  # Bytes of homepage HTML searched for the cf-token
+
+# Request coalescing across config entries
+MAX_COALESCED_RADIUS = 25  # Largest enclosing search radius (miles) used to serve several entries
+COALESCE_RESULT_TTL = 120  # Seconds a shared response is reused by entries refreshing shortly after
+RESPONSE_CACHE_SIZE = 64  # PetrolPrices responses kept for ETag revalidation
+
+# Persistent storage
+STORAGE_VERSION = 1
+STORAGE_SAVE_DELAY = 30  # Seconds to batch writes before flushing a store to disk
+GEOCODE_STORAGE_KEY = f"{DOMAIN}.geocode"
+GEOCODE_CACHE_TTL = timedelta(days=90)  # Postcodes don't move; re-geocode rarely
+FEATURES_STORAGE_KEY = f"{DOMAIN}.features"
+HISTORY_FILE = f"{DOMAIN}.history.bin"  # Binary price history, see history.py
+SNAPSHOT_STORAGE_KEY = f"{DOMAIN}.snapshot.{{entry_id}}"  # Last good refresh per config entry
+FEATURES_CACHE_TTL = timedelta(days=7)  # Re-check station facilities weekly
+FEATURE_MATCH_RADIUS = 0.1  # Miles between PetrolPrices and PetrolMap positions to treat as one station
+CLOUDFLARE_STORAGE_KEY = f"{DOMAIN}.cloudflare"  # Cloudflare cookies and cf-token with their expiry
+STATIONS_STORAGE_KEY = f"{DOMAIN}.stations"  # Every station ever seen, for the spatial index
+SPATIAL_CELL_DEGREES = 0.1  # Spatial index grid cell size (~7 x 4 miles across the UK)
+
+# Services
+SERVICE_FIND_STATIONS = "find_stations"
+
+# Price history (seconds unless noted)
+HISTORY_CAPACITY = 96  # Points kept per station fuel
+HISTORY_FULL_RESOLUTION = 2 * 86400  # Every point is kept for this long
+HISTORY_BUCKET = 6 * 3600  # Older points are thinned to one per bucket
+HISTORY_STATS_WINDOW = 7 * 86400  # Window for min/mean/max attributes
 
 # API notes
 API_GUEST_LIMIT_NOTE = (
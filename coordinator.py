@@ -0,0 +1,171 @@
+# coordinator.py
+import logging
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.util import dt as dt_util
+from .const import DOMAIN, UPDATE_INTERVAL, FUEL_TYPE_NAMES, STATION_RETIRE_AFTER
+from .geo import haversine_miles
+from .ranking import FuelRanking
+
+_LOGGER = logging.getLogger(__name__)
+
+def get_entry_config(config_entry):
+    """Return the entry's settings, with options overriding the original data."""
+    return {**config_entry.data, **config_entry.options}
+
+def _price_signature(price):
+    """Return everything a price sensor shows, so any difference means a state write."""
+    return (price.value, price.recorded)
+
+def _station_signature(station):
+    """Return everything a station sensor shows."""
+    return (
+        station.name, station.address, station.postcode, station.brand,
+        station.latitude, station.longitude, station.features, station.last_updated,
+    )
+
+def _retire_missing(missing, vanished, present, now):
+    """Track when keys stopped being reported and return those missing for STATION_RETIRE_AFTER.
+
+    missing maps each key to when it was last seen; keys reported again are dropped
+    from it, and so are the retired ones.
+    """
+    for key in vanished:
+        missing.setdefault(key, now)
+    for key in missing.keys() & present:
+        del missing[key]
+    retired = frozenset(key for key, since in missing.items() if now - since >= STATION_RETIRE_AFTER)
+    for key in retired:
+        del missing[key]
+    return retired
+
+class PetrolMapCoordinator(DataUpdateCoordinator):
+    """Coordinator that works out which station prices changed on each update.
+
+    Before listeners run, the new data is compared with the previous update per
+    (station id, fuel type), and per station id for the station metadata. Entities
+    use `changed`/`stations_changed` to skip state writes when nothing they show
+    moved, and the sensor platform uses `added`, `removed` and `stations_removed`
+    to create and retire entities. A price or station that drops out of a response
+    is only `vanished` at first, and stays in `missing` (its entities unavailable)
+    until it comes back or has been gone for STATION_RETIRE_AFTER, when it is
+    `removed`. Refreshes are timed by the entry's RefreshScheduler rather than a
+    fixed interval.
+    """
+
+    def __init__(self, hass: HomeAssistant, update_method, scheduler):
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=DOMAIN,
+            update_method=update_method,
+            update_interval=UPDATE_INTERVAL,
+        )
+        self.scheduler = scheduler
+        self._signatures = {}
+        self._station_signatures = {}
+        self._last_success = None
+        self._missing = {}  # (station id, fuel type) -> when it was last reported
+        self._stations_missing = {}  # station id -> when it was last reported
+        self.changed = frozenset()
+        self.added = frozenset()
+        self.vanished = frozenset()
+        self.missing = frozenset()
+        self.removed = frozenset()
+        self.stations_changed = frozenset()
+        self.stations_vanished = frozenset()
+        self.stations_missing = frozenset()
+        self.stations_removed = frozenset()
+        self.availability_changed = False
+        self.rankings = {fuel_type: FuelRanking() for fuel_type in FUEL_TYPE_NAMES}
+        self._ranking_center = None
+
+    @callback
+    def _schedule_refresh(self):
+        """Schedule the next refresh when the RefreshScheduler wants it."""
+        self.update_interval = self.scheduler.next_interval()
+        super()._schedule_refresh()
+
+    @callback
+    def async_update_listeners(self):
+        """Compute the delta against the previous update, then notify listeners."""
+        self._async_compute_delta()
+        super().async_update_listeners()
+
+    @callback
+    def _async_compute_delta(self):
+        self.availability_changed = self.last_update_success != self._last_success
+        self._last_success = self.last_update_success
+
+        stations = (self.data or {}).get("stations") or {}
+        signatures = {}
+        station_signatures = {}
+        for station_id, station in stations.items():
+            station_signatures[station_id] = _station_signature(station)
+            for fuel_type, price in station.prices.items():
+                signatures[(station_id, fuel_type)] = _price_signature(price)
+
+        now = dt_util.utcnow()
+        previous = self._signatures
+        self.added = frozenset(signatures.keys() - previous.keys())
+        self.vanished = frozenset(previous.keys() - signatures.keys())
+        self.removed = _retire_missing(self._missing, self.vanished, signatures.keys(), now)
+        self.missing = frozenset(self._missing)
+        self.changed = frozenset(
+            key for key, signature in signatures.items() if previous.get(key) != signature
+        )
+        self._signatures = signatures
+        previous_stations = self._station_signatures
+        self.stations_vanished = frozenset(previous_stations.keys() - station_signatures.keys())
+        self.stations_removed = _retire_missing(
+            self._stations_missing, self.stations_vanished, station_signatures.keys(), now
+        )
+        self.stations_missing = frozenset(self._stations_missing)
+        self.stations_changed = frozenset(
+            station_id for station_id, signature in station_signatures.items()
+            if previous_stations.get(station_id) != signature
+        )
+        self._station_signatures = station_signatures
+        self._async_update_rankings(stations)
+        _LOGGER.debug(
+            "%s delta: %d changed, %d added, %d missing, %d removed",
+            DOMAIN, len(self.changed), len(self.added), len(self.missing), len(self.removed),
+        )
+
+    @callback
+    def async_set_missing(self, keys, station_ids):
+        """Start the grace period of prices and stations whose entities outlived a restart unreported."""
+        now = dt_util.utcnow()
+        for key in keys:
+            self._missing.setdefault(key, now)
+        for station_id in station_ids:
+            self._stations_missing.setdefault(station_id, now)
+        self.missing = frozenset(self._missing)
+        self.stations_missing = frozenset(self._stations_missing)
+
+    @callback
+    def _async_update_rankings(self, stations):
+        """Move only the changed station prices within the per-fuel rankings."""
+        center = (self.data or {}).get("center")
+        if center != self._ranking_center:
+            # Distances are relative to the entry's location, so a move re-ranks everything
+            self.rankings = {fuel_type: FuelRanking() for fuel_type in FUEL_TYPE_NAMES}
+            self._ranking_center = center
+            updates = self._signatures.keys()
+        else:
+            updates = self.changed
+        for station_id, fuel_type in self.vanished:
+            if fuel_type in self.rankings:
+                self.rankings[fuel_type].discard(station_id)
+        for station_id, fuel_type in updates:
+            if fuel_type not in self.rankings:
+                continue
+            station = stations[station_id]
+            distance = None
+            if center is not None and station.latitude is not None:
+                distance = round(haversine_miles(center[0], center[1], station.latitude, station.longitude), 2)
+            self.rankings[fuel_type].upsert(station_id, station.prices[fuel_type].value, distance)
+
+    def get_station(self, station_id):
+        """Return the current Station record for station_id, or None if it is gone."""
+        return ((self.data or {}).get("stations") or {}).get(station_id)
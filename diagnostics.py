@@ -0,0 +1,26 @@
+# diagnostics.py
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN, CONF_API_KEY, CONF_POSTCODE
+from .coordinator import get_entry_config
+from .metrics import async_get_metrics
+
+TO_REDACT = {CONF_API_KEY, CONF_POSTCODE}
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, config_entry):
+    """Return refresh timings, request counters and scheduler state for a config entry."""
+    coordinator = hass.data[DOMAIN].get(config_entry.entry_id)
+    metrics = async_get_metrics(hass)
+    diagnostics = {
+        "config": async_redact_data(get_entry_config(config_entry), TO_REDACT),
+        "last_refresh": metrics.last_refresh.get(config_entry.entry_id),
+        "metrics": metrics.as_dict(),
+    }
+    if coordinator is not None:
+        diagnostics["coordinator"] = {
+            "last_update_success": coordinator.last_update_success,
+            "update_interval": str(coordinator.update_interval),
+            "stations": len((coordinator.data or {}).get("stations") or {}),
+            "scheduler": coordinator.scheduler.as_dict(),
+        }
+    return diagnostics
\ No newline at end of file
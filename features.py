@@ -0,0 +1,141 @@
+# features.py
+import logging
+import time
+import async_timeout
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util.json import json_loads
+from .const import (
+    PETROLMAP_API_URL, API_TIMEOUT, STORAGE_VERSION, STORAGE_SAVE_DELAY,
+    FEATURES_STORAGE_KEY, FEATURES_CACHE_TTL, FEATURE_MATCH_RADIUS
+)
+from .api import async_get_loaded
+from .geo import haversine_miles
+from .geocode import normalize_postcode
+from .metrics import async_get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+# Grid cell size in degrees for the coordinate index (~70-110 m across the UK)
+_COORD_CELL = 0.001
+
+def _coord_cell(lat, lng):
+    return int(lat // _COORD_CELL), int(lng // _COORD_CELL)
+
+def _petrolmap_coords(pm_station):
+    """Return (lat, lng) for a PetrolMap station, or None if it has no usable position."""
+    for lat_key, lng_key in (("Latitude", "Longitude"), ("lat", "lng"), ("latitude", "longitude")):
+        try:
+            return float(pm_station[lat_key]), float(pm_station[lng_key])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+class PetrolMapIndex:
+    """Lookup of PetrolMap stations by normalised postcode and by position.
+
+    Built once per PetrolMap response so matching a PetrolPrices station is a
+    dictionary lookup rather than a scan of every PetrolMap station.
+    """
+
+    def __init__(self, pm_stations):
+        self._by_postcode = {}
+        self._by_cell = {}
+        for pm_station in pm_stations:
+            features = pm_station.get("Features", [])
+            postcode = normalize_postcode(pm_station.get("Postcode"))
+            if postcode:
+                self._by_postcode.setdefault(postcode, features)
+            coords = _petrolmap_coords(pm_station)
+            if coords is not None:
+                self._by_cell.setdefault(_coord_cell(*coords), []).append((coords, features))
+
+    def match(self, station):
+        """Return PetrolMap features for a station, or None if it isn't in the response."""
+        features = self._by_postcode.get(normalize_postcode(station.postcode))
+        if features is not None:
+            return features
+        lat, lng = station.latitude, station.longitude
+        if lat is None or lng is None:
+            return None
+        cell_lat, cell_lng = _coord_cell(lat, lng)
+        best, best_distance = None, FEATURE_MATCH_RADIUS
+        for dlat in (-1, 0, 1):
+            for dlng in (-1, 0, 1):
+                for (pm_lat, pm_lng), pm_features in self._by_cell.get((cell_lat + dlat, cell_lng + dlng), ()):
+                    distance = haversine_miles(lat, lng, pm_lat, pm_lng)
+                    if distance <= best_distance:
+                        best, best_distance = pm_features, distance
+        return best
+
+class FeatureCache:
+    """Persistent station id -> PetrolMap features cache.
+
+    Stations with no PetrolMap match are cached with an empty list too, so they
+    are not looked up again until the entry expires after FEATURES_CACHE_TTL.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._store = Store(hass, STORAGE_VERSION, FEATURES_STORAGE_KEY)
+        self._stations = {}
+
+    async def async_load(self):
+        stored = await self._store.async_load() or {}
+        self._stations = stored.get("stations", {})
+        _LOGGER.debug(f"Loaded cached features for {len(self._stations)} stations")
+
+    def get(self, station_id, allow_stale=False):
+        """Return cached features for a station, or None if unknown or expired."""
+        entry = self._stations.get(station_id)
+        if entry is None:
+            return None
+        features, fetched_at = entry
+        if not allow_stale and time.time() - fetched_at > FEATURES_CACHE_TTL.total_seconds():
+            return None
+        return features
+
+    def set(self, station_id, features):
+        self._stations[station_id] = [features, time.time()]
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    def _data_to_save(self):
+        return {"stations": self._stations}
+
+async def async_get_feature_cache(hass: HomeAssistant) -> FeatureCache:
+    """Return the shared feature cache, loading it from disk on first use."""
+    return await async_get_loaded(hass, "feature_cache", FeatureCache)
+
+async def async_enrich_stations(hass: HomeAssistant, session, stations, postcode, distance):
+    """Attach PetrolMap features to stations, fetching only for missing or stale ones."""
+    cache = await async_get_feature_cache(hass)
+    missing = [station_id for station_id in stations if cache.get(station_id) is None]
+    metrics = async_get_metrics(hass)
+    metrics.count("feature_cache_hits", len(stations) - len(missing))
+    if missing:
+        _LOGGER.debug("Fetching PetrolMap features for %d stations", len(missing))
+        metrics.count("petrolmap_requests")
+        petrolmap_url = f"{PETROLMAP_API_URL}?address={postcode}&fuel_type=petrol&search_type=postcode&brand=any&distance={distance}&p=map"
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36",
+            "accept": "*/*",
+            "accept-encoding": "gzip, deflate, br",
+            "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
+        }
+        try:
+            async with async_timeout.timeout(API_TIMEOUT):
+                async with session.get(petrolmap_url, headers=headers) as response:
+                    if response.status != 200:
+                        _LOGGER.warning(f"PetrolMap API failed with status {response.status}")
+                    else:
+                        body = await response.read()
+                        metrics.count("bytes_transferred", response.content_length or 0)
+                        metrics.count("bytes_decoded", len(body))
+                        petrolmap_data = json_loads(body)
+                        index = PetrolMapIndex(petrolmap_data.get("data", []))
+                        for station_id in missing:
+                            cache.set(station_id, index.match(stations[station_id]) or [])
+        except Exception as e:
+            _LOGGER.warning(f"PetrolMap API error, proceeding without features: {str(e)}")
+
+    for station_id, station in stations.items():
+        station.features = cache.get(station_id, allow_stale=True) or []
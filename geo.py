@@ -0,0 +1,68 @@
+# geo.py
+import math
+from .const import MAX_COALESCED_RADIUS
+
+EARTH_RADIUS_MILES = 3958.8
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    """Return the great-circle distance between two points in miles."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+def point_segment_miles(lat, lng, start, end):
+    """Return the approximate distance in miles from a point to the segment start-end.
+
+    Uses an equirectangular projection centred on the point, which is accurate to
+    well under 1% at the tens-of-miles scale of route corridors.
+    """
+    miles_per_degree = EARTH_RADIUS_MILES * math.pi / 180
+    scale = math.cos(math.radians(lat))
+    ax, ay = (start[1] - lng) * scale * miles_per_degree, (start[0] - lat) * miles_per_degree
+    bx, by = (end[1] - lng) * scale * miles_per_degree, (end[0] - lat) * miles_per_degree
+    dx, dy = bx - ax, by - ay
+    length_squared = dx * dx + dy * dy
+    t = 0.0 if length_squared == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length_squared))
+    return math.hypot(ax + t * dx, ay + t * dy)
+
+def plan_query_region(areas, entry_id):
+    """Return the (lat, lng, radius) to query upstream for one config entry.
+
+    areas maps entry_id -> (lat, lng, radius, api_key). Entries with the same API key
+    whose circles overlap, directly or through a chain of neighbours, share one
+    enclosing circle so a single upstream query can serve all of them. Every member
+    of a group computes the same circle, which keeps request keys identical for
+    coalescing. Groups whose enclosing circle would exceed MAX_COALESCED_RADIUS fall
+    back to the entry's own circle.
+    """
+    lat, lng, radius, api_key = areas[entry_id]
+    own_region = (lat, lng, radius)
+
+    # Flood fill over overlapping circles, in a stable order
+    candidates = {
+        other_id: area for other_id, area in areas.items() if area[3] == api_key
+    }
+    group = {entry_id}
+    frontier = [entry_id]
+    while frontier:
+        current = candidates[frontier.pop()]
+        for other_id, other in candidates.items():
+            if other_id in group:
+                continue
+            if haversine_miles(current[0], current[1], other[0], other[1]) < current[2] + other[2]:
+                group.add(other_id)
+                frontier.append(other_id)
+    if len(group) == 1:
+        return own_region
+
+    members = [candidates[member_id] for member_id in sorted(group)]
+    center_lat = (min(m[0] for m in members) + max(m[0] for m in members)) / 2
+    center_lng = (min(m[1] for m in members) + max(m[1] for m in members)) / 2
+    enclosing_radius = math.ceil(max(
+        haversine_miles(center_lat, center_lng, m[0], m[1]) + m[2] for m in members
+    ))
+    if enclosing_radius > MAX_COALESCED_RADIUS:
+        return own_region
+    return round(center_lat, 6), round(center_lng, 6), enclosing_radius
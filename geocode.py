@@ -0,0 +1,150 @@
+# geocode.py
+import logging
+import asyncio
+import time
+import async_timeout
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ConfigEntryError
+from homeassistant.helpers.storage import Store
+from .const import (
+    GEOCODE_API_URL, API_TIMEOUT, STORAGE_VERSION, STORAGE_SAVE_DELAY,
+    GEOCODE_STORAGE_KEY, GEOCODE_CACHE_TTL
+)
+from .api import async_get_loaded
+from .metrics import async_get_metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+def normalize_postcode(postcode):
+    """Return a postcode without spaces in upper case, e.g. 'BT25 2NF' -> 'BT252NF'."""
+    return (postcode or "").replace(" ", "").replace("+", "").upper()
+
+class GeocodeCache:
+    """Persistent postcode -> (lat, lng) cache.
+
+    Postcodes are stored with the time they were geocoded and are served without
+    any network traffic until GEOCODE_CACHE_TTL expires. Expired entries are still
+    used when both geocoders are down.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, GEOCODE_STORAGE_KEY)
+        self._postcodes = {}
+
+    async def async_load(self):
+        """Load cached postcodes."""
+        stored = await self._store.async_load() or {}
+        self._postcodes = stored.get("postcodes", {})
+        _LOGGER.debug(f"Loaded {len(self._postcodes)} cached postcodes")
+
+    def get(self, postcode, allow_stale=False):
+        """Return cached (lat, lng) for a postcode, or None if unknown or expired."""
+        entry = self._postcodes.get(normalize_postcode(postcode))
+        if entry is None:
+            return None
+        lat, lng, geocoded_at = entry
+        if not allow_stale and time.time() - geocoded_at > GEOCODE_CACHE_TTL.total_seconds():
+            return None
+        return lat, lng
+
+    def set(self, postcode, lat, lng):
+        """Cache a geocoded postcode."""
+        self._postcodes[normalize_postcode(postcode)] = [lat, lng, time.time()]
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    def _data_to_save(self):
+        return {"postcodes": self._postcodes}
+
+async def async_get_geocode_cache(hass: HomeAssistant) -> GeocodeCache:
+    """Return the shared geocode cache, loading it from disk on first use."""
+    return await async_get_loaded(hass, "geocode_cache", GeocodeCache)
+
+async def async_geocode_postcode(hass: HomeAssistant, session, postcode):
+    """Resolve a postcode to (lat, lng).
+
+    Order: fresh cache entry, Nominatim, FreeMapTools, stale cache entry.
+    """
+    cache = await async_get_geocode_cache(hass)
+    metrics = async_get_metrics(hass)
+    coords = cache.get(postcode)
+    if coords is not None:
+        _LOGGER.debug("Geocode cache hit for postcode %s: %s", postcode, coords)
+        metrics.count("geocode_cache_hits")
+        return coords
+
+    metrics.count("geocode_lookups")
+    try:
+        lat, lng = await _async_geocode_online(session, postcode)
+    except ConfigEntryError as e:
+        coords = cache.get(postcode, allow_stale=True)
+        if coords is None:
+            raise
+        _LOGGER.warning(f"Geocoding unavailable for {postcode}, using offline location {coords}: {str(e)}")
+        return coords
+
+    cache.set(postcode, lat, lng)
+    return lat, lng
+
+async def _async_geocode_online(session, postcode):
+    """Geocode postcode using Nominatim with fallback to FreeMapTools."""
+    lat, lng = None, None
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            async with async_timeout.timeout(API_TIMEOUT):
+                geocode_url = f"{GEOCODE_API_URL}?q={postcode}&format=json&limit=1"
+                headers = {"User-Agent": "HomeAssistant/1.0"}
+                _LOGGER.debug(f"Attempting Nominatim geocoding for postcode {postcode}")
+                async with session.get(geocode_url, headers=headers) as response:
+                    if response.status != 200:
+                        text = await response.text()
+                        _LOGGER.warning(f"Nominatim geocoding failed with status {response.status}: {text}")
+                        break
+                    geocode_data = await response.json()
+                    if not geocode_data:
+                        _LOGGER.warning(f"No coordinates found for postcode {postcode} in Nominatim")
+                        break
+                    lat = float(geocode_data[0]["lat"])
+                    lng = float(geocode_data[0]["lon"])
+                    _LOGGER.debug(f"Geocoded {postcode} to lat: {lat}, lng: {lng}")
+                    break
+        except Exception as e:
+            _LOGGER.warning(f"Nominatim geocoding error on attempt {attempt + 1}: {str(e)}")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(2 ** attempt)
+                continue
+            break
+
+    # Fallback to FreeMapTools if Nominatim fails
+    if lat is None or lng is None:
+        _LOGGER.debug(f"Falling back to FreeMapTools for postcode {postcode}")
+        try:
+            async with async_timeout.timeout(API_TIMEOUT):
+                fallback_url = f"https://www.freemaptools.com/ajax/uk/uk-postcode-to-lat-lng.php?postcode={postcode}&alsosearchterminated=true"
+                headers = {
+                    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36",
+                    "accept": "*/*",
+                    "accept-encoding": "gzip, deflate, br",
+                    "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
+                    "referer": "https://www.freemaptools.com/convert-uk-postcode-to-lat-lng.htm"
+                }
+                async with session.get(fallback_url, headers=headers) as response:
+                    if response.status != 200:
+                        text = await response.text()
+                        _LOGGER.error(f"FreeMapTools geocoding failed with status {response.status}: {text}")
+                        raise ConfigEntryError(f"FreeMapTools geocoding failed with status {response.status}")
+                    geocode_data = await response.json()
+                    if geocode_data.get("status") != 1 or not geocode_data.get("output"):
+                        _LOGGER.error(f"Invalid FreeMapTools geocoding data: {geocode_data}")
+                        raise ConfigEntryError("Invalid FreeMapTools geocoding response")
+                    lat = float(geocode_data["output"][0]["latitude"])
+                    lng = float(geocode_data["output"][0]["longitude"])
+                    _LOGGER.debug(f"FreeMapTools geocoded {postcode} to lat: {lat}, lng: {lng}")
+        except Exception as e:
+            _LOGGER.error(f"FreeMapTools geocoding error: {str(e)}")
+            raise ConfigEntryError(f"Geocoding failed after retries: {str(e)}")
+
+    if lat is None or lng is None:
+        raise ConfigEntryError(f"No coordinates found for postcode {postcode} after all attempts")
+    return lat, lng
@@ -0,0 +1,231 @@
+# history.py
+import logging
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime
+from homeassistant.const import EVENT_HOMEASSISTANT_FINAL_WRITE
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+from .const import (
+    STORAGE_SAVE_DELAY, HISTORY_FILE, HISTORY_CAPACITY, HISTORY_FULL_RESOLUTION,
+    HISTORY_BUCKET, HISTORY_STATS_WINDOW
+)
+from .api import async_get_loaded
+
+_LOGGER = logging.getLogger(__name__)
+
+_MAGIC = b"PMH1"
+_HEADER = struct.Struct("<4sI")  # magic, series count
+_SERIES_HEADER = struct.Struct("<BHB")  # station id length, point count, fuel type
+# Followed by the station id, then little-endian int64 timestamps and float32 prices
+_DAY = 86400
+
+def _recorded_timestamp(recorded):
+    try:
+        return int(datetime.fromisoformat(recorded.replace("Z", "+00:00")).timestamp())
+    except (AttributeError, ValueError):
+        return None
+
+class PriceSeries:
+    """Bounded time series of one station's price for one fuel type.
+
+    Points live in two parallel typed arrays (int64 seconds, float32 price) ordered
+    by recorded time. Points older than HISTORY_FULL_RESOLUTION are thinned to the
+    last point per HISTORY_BUCKET, and the oldest are dropped beyond HISTORY_CAPACITY.
+    Window statistics are recomputed on each write and each refresh that reports
+    the series again, so reads are O(1) and an unchanged price still ages out.
+    """
+
+    __slots__ = ("times", "prices", "stats")
+
+    def __init__(self, times=None, prices=None):
+        self.times = times if times is not None else array("q")
+        self.prices = prices if prices is not None else array("f")
+        self.stats = {}
+
+    def add(self, timestamp, price, now):
+        """Record a price reported at timestamp. Returns False for duplicates and stale points."""
+        if self.times and timestamp <= self.times[-1]:
+            return False
+        self.times.append(timestamp)
+        self.prices.append(price)
+        self._compact(now)
+        self.update_stats(now)
+        return True
+
+    def _compact(self, now):
+        cutoff = now - HISTORY_FULL_RESOLUTION
+        if len(self.times) > 1 and self.times[0] < cutoff:
+            times, prices = array("q"), array("f")
+            for index, timestamp in enumerate(self.times):
+                if timestamp < cutoff and times and timestamp // HISTORY_BUCKET == times[-1] // HISTORY_BUCKET:
+                    # Same bucket as the previous old point: keep only the latest
+                    times[-1], prices[-1] = timestamp, self.prices[index]
+                    continue
+                times.append(timestamp)
+                prices.append(self.prices[index])
+            self.times, self.prices = times, prices
+        overflow = len(self.times) - HISTORY_CAPACITY
+        if overflow > 0:
+            del self.times[:overflow]
+            del self.prices[:overflow]
+
+    def update_stats(self, now):
+        """Recompute the rolling statistics served to sensors."""
+        if not self.times:
+            self.stats = {}
+            return
+        window_start = now - HISTORY_STATS_WINDOW
+        # The window opens with the price in force at its start, if it was recorded before then
+        window = []
+        for timestamp, price in zip(self.times, self.prices):
+            if timestamp <= window_start:
+                window[:] = (price,)
+            else:
+                window.append(price)
+        # Price in force a day ago: the last point recorded at or before then
+        day_ago = now - _DAY
+        previous = None
+        for timestamp, price in zip(self.times, self.prices):
+            if timestamp > day_ago:
+                break
+            previous = price
+        current = self.prices[-1]
+        self.stats = {
+            "min_7d": round(min(window), 2),
+            "mean_7d": round(sum(window) / len(window), 2),
+            "max_7d": round(max(window), 2),
+            "change_24h": round(current - previous, 2) if previous is not None else None,
+        }
+
+class PriceHistory:
+    """Price history for every station and fuel type seen by any config entry.
+
+    Kept in memory and persisted as a compact binary file in .storage, so trend
+    statistics are available without recording every sensor in the HA recorder.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._path = hass.config.path(".storage", HISTORY_FILE)
+        self._series = {}
+        self._unsub_save = None
+
+    async def async_load(self):
+        """Read the history file, and flush pending changes when Home Assistant stops."""
+        self._series = await self._hass.async_add_executor_job(self._read)
+        now = int(datetime.now().timestamp())
+        for series in self._series.values():
+            series.update_stats(now)
+        _LOGGER.debug(f"Loaded price history for {len(self._series)} station fuels")
+
+        async def _async_flush(event):
+            await self.async_flush()
+
+        self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_FINAL_WRITE, _async_flush)
+
+    def stats(self, station_id, fuel_type):
+        """Return precomputed statistics for a station fuel, or an empty dict."""
+        series = self._series.get((station_id, fuel_type))
+        return series.stats if series is not None else {}
+
+    @callback
+    def async_record(self, stations, now):
+        """Add the current price of every station fuel, ignoring already recorded points.
+
+        Series that get no new point still have their statistics recomputed, so the
+        windows move on while a price stays unchanged.
+        """
+        timestamp_now = int(now.timestamp())
+        added = 0
+        for station_id, station in stations.items():
+            for fuel_type, price in station.prices.items():
+                timestamp = _recorded_timestamp(price.recorded)
+                if timestamp is None:
+                    continue
+                key = (station_id, fuel_type)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = PriceSeries()
+                if series.add(timestamp, price.value, timestamp_now):
+                    added += 1
+                else:
+                    series.update_stats(timestamp_now)
+        if added:
+            _LOGGER.debug("Recorded %d new price points", added)
+            self._async_schedule_save()
+
+    @callback
+    def _async_schedule_save(self):
+        if self._unsub_save is None:
+            self._unsub_save = async_call_later(self._hass, STORAGE_SAVE_DELAY, self._async_save)
+
+    async def _async_save(self, _now=None):
+        self._unsub_save = None
+        data = self._serialize()
+        await self._hass.async_add_executor_job(self._write, data)
+
+    async def async_flush(self):
+        """Write pending changes immediately."""
+        if self._unsub_save is not None:
+            self._unsub_save()
+            await self._async_save()
+
+    def _serialize(self):
+        chunks = [_HEADER.pack(_MAGIC, len(self._series))]
+        for (station_id, fuel_type), series in self._series.items():
+            encoded_id = station_id.encode("utf-8")
+            chunks.append(_SERIES_HEADER.pack(len(encoded_id), len(series.times), fuel_type))
+            chunks.append(encoded_id)
+            times, prices = series.times, series.prices
+            if sys.byteorder == "big":
+                times, prices = array("q", times), array("f", prices)
+                times.byteswap()
+                prices.byteswap()
+            chunks.append(times.tobytes())
+            chunks.append(prices.tobytes())
+        return b"".join(chunks)
+
+    def _write(self, data):
+        temp_path = f"{self._path}.tmp"
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, self._path)
+
+    def _read(self):
+        try:
+            with open(self._path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return {}
+        series = {}
+        try:
+            magic, count = _HEADER.unpack_from(data, 0)
+            if magic != _MAGIC:
+                raise ValueError("unknown file format")
+            offset = _HEADER.size
+            for _ in range(count):
+                id_length, points, fuel_type = _SERIES_HEADER.unpack_from(data, offset)
+                offset += _SERIES_HEADER.size
+                station_id = data[offset:offset + id_length].decode("utf-8")
+                offset += id_length
+                times, prices = array("q"), array("f")
+                times.frombytes(data[offset:offset + points * times.itemsize])
+                offset += points * times.itemsize
+                prices.frombytes(data[offset:offset + points * prices.itemsize])
+                offset += points * prices.itemsize
+                if sys.byteorder == "big":
+                    times.byteswap()
+                    prices.byteswap()
+                series[(station_id, fuel_type)] = PriceSeries(times, prices)
+        except (struct.error, ValueError, UnicodeDecodeError) as e:
+            _LOGGER.warning(f"Discarding unreadable price history {self._path}: {str(e)}")
+            return {}
+        return series
+
+async def async_get_price_history(hass: HomeAssistant) -> PriceHistory:
+    """Return the shared price history, loading it from disk on first use."""
+    return await async_get_loaded(hass, "price_history", PriceHistory)
\ No newline at end of file
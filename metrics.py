@@ -0,0 +1,123 @@
+# metrics.py
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN, METRICS_LATENCY_BUCKETS
+
+# Every counter PipelineMetrics.count is called with
+COUNTERS = (
+    "requests", "retries", "not_modified", "rate_limited", "limit_exceeded", "quota_skipped", "client_errors",
+    "coalesced", "bytes_transferred", "bytes_decoded", "cloudflare_refreshes", "cloudflare_reauth",
+    "geocode_lookups", "geocode_cache_hits", "petrolmap_requests", "feature_cache_hits", "refreshes",
+    "refresh_errors",
+)
+
+class Histogram:
+    """Fixed-bucket latency histogram in seconds, cheap enough to update on every call."""
+
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_LATENCY_BUCKETS) + 1)  # Last bucket is overflow
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(METRICS_LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def as_dict(self):
+        buckets = {f"le_{bound}": count for bound, count in zip(METRICS_LATENCY_BUCKETS, self.counts)}
+        buckets["gt_max"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4) if self.count else None,
+            "max": round(self.maximum, 4),
+            "buckets": buckets,
+        }
+
+class PipelineMetrics:
+    """Latency histograms per update phase and counters shared by all config entries.
+
+    Phases are named after the step of async_update_data they time (geocode,
+    cloudflare, fetch, parse, filter, features, history, total); upstream requests
+    are additionally timed per fuel type as fetch_fuel_<type>. The last refresh of
+    every entry is kept with its own per-phase breakdown.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.last_refresh = {}
+
+    def observe(self, phase, seconds):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = Histogram()
+        histogram.observe(seconds)
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextmanager
+    def timed(self, phase):
+        """Observe the wall time of the enclosed block under phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - started)
+
+    def refresh_timer(self, entry_id):
+        """Return a RefreshTimer collecting one refresh of entry_id."""
+        return RefreshTimer(self, entry_id)
+
+    def as_dict(self):
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "latency": {phase: histogram.as_dict() for phase, histogram in sorted(self.histograms.items())},
+        }
+
+class RefreshTimer:
+    """Times the phases of one refresh into the shared histograms and the entry's summary."""
+
+    def __init__(self, metrics, entry_id):
+        self._metrics = metrics
+        self._entry_id = entry_id
+        self._started = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[name] = round(self.phases.get(name, 0) + elapsed, 4)
+            self._metrics.observe(name, elapsed)
+
+    def finish(self, stations, success=True):
+        """Record the total duration and keep this refresh as the entry's last one."""
+        elapsed = time.perf_counter() - self._started
+        self._metrics.observe("total", elapsed)
+        self._metrics.count("refreshes" if success else "refresh_errors")
+        self._metrics.last_refresh[self._entry_id] = {
+            "finished": time.time(),
+            "duration": round(elapsed, 4),
+            "success": success,
+            "stations": stations,
+            "phases": self.phases,
+        }
+
+def async_get_metrics(hass: HomeAssistant) -> PipelineMetrics:
+    """Return the update pipeline metrics shared by all config entries."""
+    metrics = hass.data[DOMAIN].get("metrics")
+    if metrics is None:
+        metrics = hass.data[DOMAIN]["metrics"] = PipelineMetrics()
+    return metrics
\ No newline at end of file
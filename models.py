@@ -0,0 +1,125 @@
+# models.py
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from .const import PRICE_AGE_LIMIT_DAYS
+
+@dataclass(slots=True)
+class Price:
+    """A single fuel price reported for a station."""
+
+    value: float
+    recorded: str  # ISO 8601 timestamp as reported by PetrolPrices
+
+@dataclass(slots=True)
+class Station:
+    """A fuel station and its current prices, keyed by fuel type."""
+
+    id: str
+    name: str
+    address: str
+    postcode: str
+    latitude: float
+    longitude: float
+    brand: str
+    prices: dict = field(default_factory=dict)
+    features: list = field(default_factory=list)
+
+    @property
+    def last_updated(self):
+        """Return the most recent recorded time across this station's prices."""
+        return max((price.recorded for price in self.prices.values()), default=None)
+
+    def as_dict(self):
+        """Return a JSON-serialisable representation for persistent storage."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "address": self.address,
+            "postcode": self.postcode,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "brand": self.brand,
+            "prices": {str(fuel_type): [price.value, price.recorded] for fuel_type, price in self.prices.items()},
+            "features": self.features,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a station from as_dict() output."""
+        return cls(
+            id=data["id"],
+            name=data["name"],
+            address=data["address"],
+            postcode=data["postcode"],
+            latitude=data["latitude"],
+            longitude=data["longitude"],
+            brand=data["brand"],
+            prices={int(fuel_type): Price(*price) for fuel_type, price in data["prices"].items()},
+            features=data.get("features", []),
+        )
+
+def _parse_recorded_time(recorded):
+    try:
+        return datetime.fromisoformat(recorded.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+
+def parse_feature_collection(data, fuel_type, stations, now=None):
+    """Merge one PetrolPrices geojson response into stations (station id -> Station).
+
+    Features with a zero price are skipped before any other work, and the price age
+    cutoff is computed once per response rather than once per feature.
+    """
+    features = (data.get("data") or {}).get("features") or ()
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=PRICE_AGE_LIMIT_DAYS + 1)
+    for feature in features:
+        properties = feature.get("properties") or {}
+        raw_price = properties.get("price") or 0
+        if raw_price <= 0:
+            continue
+        station_id = str(properties["idstation"])
+        station = stations.get(station_id)
+        if station is None:
+            coordinates = (feature.get("geometry") or {}).get("coordinates") or (None, None)
+            station = stations[station_id] = Station(
+                id=station_id,
+                name=properties.get("name") or "Unknown",
+                address=", ".join(
+                    part for part in (properties.get("address1"), properties.get("address2"), properties.get("town"))
+                    if part
+                ) or "Unknown",
+                postcode=properties.get("postcode") or "Unknown",
+                latitude=coordinates[1],
+                longitude=coordinates[0],
+                brand=properties.get("fuel_brand_name") or "Unknown",
+            )
+        recorded = properties.get("recorded_time")
+        recorded_at = _parse_recorded_time(recorded)
+        if recorded_at is not None and recorded_at > cutoff:
+            station.prices[fuel_type] = Price(raw_price / 10, recorded)  # Convert pence to GBP
+    return stations
+
+def carry_forward_prices(previous, stations, fuel_type):
+    """Copy fuel_type prices from the previous update into stations.
+
+    Used when a fuel type could not be fetched this refresh (quota, 429), so its
+    sensors keep their last known price instead of disappearing until the next one.
+    """
+    for station_id, old_station in previous.items():
+        price = old_station.prices.get(fuel_type)
+        if price is None:
+            continue
+        station = stations.get(station_id)
+        if station is None:
+            station = stations[station_id] = Station(
+                id=old_station.id,
+                name=old_station.name,
+                address=old_station.address,
+                postcode=old_station.postcode,
+                latitude=old_station.latitude,
+                longitude=old_station.longitude,
+                brand=old_station.brand,
+            )
+        station.prices.setdefault(fuel_type, price)
+    return stations
@@ -0,0 +1,43 @@
+# ranking.py
+import math
+from bisect import bisect_left, insort
+
+class FuelRanking:
+    """Stations offering one fuel type, kept ordered by price then distance.
+
+    Updated incrementally from the coordinator's per-station delta, so each refresh
+    only moves the stations whose price changed instead of re-sorting everything.
+    """
+
+    __slots__ = ("_order", "_entries")
+
+    def __init__(self):
+        self._order = []  # Sorted (price, distance, station_id) tuples
+        self._entries = {}  # station_id -> its tuple in _order
+
+    def __len__(self):
+        return len(self._order)
+
+    def upsert(self, station_id, price, distance):
+        """Insert a station or move it to the position for its new price and distance."""
+        self.discard(station_id)
+        entry = (price, math.inf if distance is None else distance, station_id)
+        insort(self._order, entry)
+        self._entries[station_id] = entry
+
+    def discard(self, station_id):
+        """Remove a station if present."""
+        entry = self._entries.pop(station_id, None)
+        if entry is not None:
+            del self._order[bisect_left(self._order, entry)]
+
+    def top(self, count):
+        """Return the cheapest count (price, distance, station_id) entries."""
+        return self._order[:count]
+
+    def cheapest_within(self, radius):
+        """Return the cheapest entry no further than radius miles away, or None."""
+        for entry in self._order:
+            if entry[1] <= radius:
+                return entry
+        return None
@@ -0,0 +1,171 @@
+# scheduler.py
+import logging
+import random
+import time
+import zlib
+from datetime import timedelta
+from .const import (
+    FUEL_TYPE_NAMES, UPDATE_INTERVAL, SCHEDULER_MIN_INTERVAL, SCHEDULER_MAX_INTERVAL,
+    SCHEDULER_TARGET_CHANGES, SCHEDULER_RATE_SMOOTHING, SCHEDULER_JITTER, SCHEDULER_STARTUP_WINDOW,
+    SCHEDULER_STARTUP_CELL, SCHEDULER_RETRY_BASE, SCHEDULER_RETRY_MAX, SCHEDULER_DUE_TOLERANCE
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+def _jittered(seconds):
+    return seconds * random.uniform(1 - SCHEDULER_JITTER, 1 + SCHEDULER_JITTER)
+
+def startup_slot_key(center):
+    """Return the startup slot key for an entry last seen at center, so neighbours start together."""
+    if center is None:
+        return None
+    return f"{round(center[0] / SCHEDULER_STARTUP_CELL)},{round(center[1] / SCHEDULER_STARTUP_CELL)}"
+
+class RefreshScheduler:
+    """Decides when a config entry refreshes next and which fuel types it fetches.
+
+    Full refreshes are spaced by how often prices in the area actually change,
+    bounded by SCHEDULER_MIN_INTERVAL/SCHEDULER_MAX_INTERVAL and by the entry's
+    share of the hourly request budget. Fuel types that hit limitExceed or a 429
+    are retried on their own with exponential backoff instead of waiting for the
+    next full refresh.
+
+    Entries whose queries are coalesced into one region share that region's
+    refresh phase (see join_region), so they keep hitting upstream together and
+    the single-flight serves them with one request. The budget is therefore
+    split between regions rather than entries, and jitter only spreads regions
+    apart from each other.
+    """
+
+    def __init__(self, entry_id, hourly_budget, slot_key=None):
+        self.hourly_budget = hourly_budget
+        self.active_regions = 1
+        self.requests_per_refresh = len(FUEL_TYPE_NAMES)  # More when an API key entry fetches in pages
+        self._change_rate = None  # Smoothed price changes per hour
+        self._last_full = None
+        self._retries = {}  # fuel type -> (attempt, monotonic time due)
+        self._phases = None
+        self._region = None
+        # Stable startup slot, so restored entries don't all refresh at once. Entries
+        # sharing slot_key (neighbours) get the same slot and can still coalesce.
+        slot = (zlib.crc32((slot_key or entry_id).encode()) % 1000) / 1000
+        jitter = random.uniform(0, 10) if slot_key is None else 0
+        self._next_full = time.monotonic() + slot * SCHEDULER_STARTUP_WINDOW + jitter
+
+    def join_region(self, phases, region):
+        """Follow the refresh phase of region, shared through phases (region -> monotonic due time)."""
+        self._phases = phases
+        self._region = region
+
+    def _full_interval(self):
+        """Return the seconds until the next full refresh, before jitter."""
+        if self._change_rate is None:
+            interval = UPDATE_INTERVAL.total_seconds()
+        elif self._change_rate <= 0:
+            interval = SCHEDULER_MAX_INTERVAL.total_seconds()
+        else:
+            interval = SCHEDULER_TARGET_CHANGES / self._change_rate * 3600
+        interval = min(max(interval, SCHEDULER_MIN_INTERVAL.total_seconds()), SCHEDULER_MAX_INTERVAL.total_seconds())
+        # Never plan more full refreshes than this entry's share of the budget allows
+        budget_floor = self.active_regions * self.requests_per_refresh / self.hourly_budget * 3600
+        return max(interval, budget_floor)
+
+    def fuel_types_due(self, fuel_types):
+        """Return the fuel types to fetch now: all of them, or only those due a retry.
+
+        The coordinator's timer can fire up to a second early, so anything due within
+        SCHEDULER_DUE_TOLERANCE counts as due. Only when nothing is due (such as a
+        manual update request) does an unscheduled refresh fetch everything.
+        """
+        now = time.monotonic()
+        due_by = now + SCHEDULER_DUE_TOLERANCE
+        retries = [
+            fuel_type for fuel_type in fuel_types
+            if fuel_type in self._retries and self._retries[fuel_type][1] <= due_by
+        ]
+        if due_by >= self._next_full or not retries:
+            # A full refresh, or an unscheduled one such as a manual update request.
+            # Provisionally book the next one so a failing refresh cannot loop quickly.
+            self._next_full = now + _jittered(self._full_interval())
+            return list(fuel_types)
+        return retries
+
+    def record_result(self, fetched, failed, changes):
+        """Update retry backoff and the area's change rate after a refresh.
+
+        fetched are the fuel types requested this time, failed the subset that were
+        skipped for quota or rate limiting, changes the number of prices that moved.
+        """
+        now = time.monotonic()
+        for fuel_type in fetched:
+            if fuel_type in failed:
+                attempt = self._retries.get(fuel_type, (0, None))[0] + 1
+                delay = min(
+                    SCHEDULER_RETRY_BASE.total_seconds() * 2 ** (attempt - 1), SCHEDULER_RETRY_MAX.total_seconds()
+                )
+                self._retries[fuel_type] = (attempt, now + _jittered(delay))
+            else:
+                self._retries.pop(fuel_type, None)
+
+        if len(fetched) == len(FUEL_TYPE_NAMES) and len(failed) < len(fetched):
+            if self._last_full is not None and now > self._last_full:
+                rate = changes / ((now - self._last_full) / 3600)
+                if self._change_rate is None:
+                    self._change_rate = rate
+                else:
+                    self._change_rate += SCHEDULER_RATE_SMOOTHING * (rate - self._change_rate)
+            self._last_full = now
+            self._next_full = self._book_full(now)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(
+                "Refresh of %d fuel types saw %d price changes, %d skipped; change rate %s per hour, next refresh in %s",
+                len(fetched), changes, len(failed), self._change_rate, self.next_interval(),
+            )
+
+    def _book_full(self, now):
+        """Return when the next full refresh is due, adopting the region's phase if one is booked."""
+        next_full = now + _jittered(self._full_interval())
+        if self._phases is None:
+            return next_full
+        shared = self._phases.get(self._region)
+        if shared is not None and shared > now:
+            # Another entry of the region already booked its next refresh
+            return shared
+        for region in [region for region, due in self._phases.items() if due <= now]:
+            del self._phases[region]
+        self._phases[self._region] = next_full
+        return next_full
+
+    def as_dict(self):
+        """Return the scheduler state for diagnostics."""
+        now = time.monotonic()
+        return {
+            "hourly_budget": self.hourly_budget,
+            "active_regions": self.active_regions,
+            "requests_per_refresh": self.requests_per_refresh,
+            "change_rate_per_hour": round(self._change_rate, 3) if self._change_rate is not None else None,
+            "next_full_refresh_in": round(self._next_full - now),
+            "retries": {
+                fuel_type: {"attempt": attempt, "due_in": round(due - now)}
+                for fuel_type, (attempt, due) in self._retries.items()
+            },
+        }
+
+    def next_interval(self):
+        """Return the delay until the next full refresh or fuel type retry, whichever is sooner."""
+        due = min([self._next_full, *(due for _, due in self._retries.values())])
+        return timedelta(seconds=max(due - time.monotonic(), 1))
+
+def count_price_changes(previous, stations, fuel_types):
+    """Count station prices of fuel_types that are new or differ from the previous update."""
+    changes = 0
+    for station_id, station in stations.items():
+        old_station = previous.get(station_id)
+        for fuel_type in fuel_types:
+            price = station.prices.get(fuel_type)
+            if price is None:
+                continue
+            old_price = old_station.prices.get(fuel_type) if old_station is not None else None
+            if old_price is None or old_price.value != price.value:
+                changes += 1
+    return changes
\ No newline at end of file
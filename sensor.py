@@ -1,8 +1,21 @@
 # sensor.py
 import logging
-from homeassistant.components.sensor import SensorEntity
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntity, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import callback
+from homeassistant.helpers import device_registry as dr, entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
-from .const import DOMAIN, FUEL_TYPE_NAMES
+from homeassistant.util import dt as dt_util
+from .const import (
+    DOMAIN, FUEL_TYPE_NAMES, CONF_POSTCODE, CONF_STATION_SENSORS, CONF_TOP_N, CONF_CHEAPEST_RADIUS,
+    CONF_DIAGNOSTIC_SENSORS, DEFAULT_STATION_SENSORS, DEFAULT_TOP_N, DEFAULT_CHEAPEST_RADIUS,
+    DEFAULT_DIAGNOSTIC_SENSORS, SIGNAL_METRICS_UPDATED
+)
+from .coordinator import get_entry_config
+from .metrics import COUNTERS, async_get_metrics
+from .spatial import async_get_station_index
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -10,64 +23,387 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     """Set up the sensor platform."""
     _LOGGER.debug(f"Setting up sensor for config entry: {config_entry.data}")
     coordinator = hass.data[DOMAIN][config_entry.entry_id]
-    entities = []
+    config = get_entry_config(config_entry)
+    top_n = config.get(CONF_TOP_N, DEFAULT_TOP_N)
+    radius = config.get(CONF_CHEAPEST_RADIUS, DEFAULT_CHEAPEST_RADIUS)
 
-    data = coordinator.data
-    _LOGGER.debug(f"Coordinator data: {data}")
-    if not data or "stations" not in data or not data["stations"]:
-        _LOGGER.warning("No valid station data available, skipping sensor creation")
+    aggregates = []
+    for fuel_type, fuel_name in FUEL_TYPE_NAMES.items():
+        aggregates.append(PetrolMapCheapestSensor(coordinator, config_entry, fuel_type, fuel_name, top_n))
+        if radius:
+            aggregates.append(PetrolMapCheapestSensor(coordinator, config_entry, fuel_type, fuel_name, top_n, radius))
+    if config.get(CONF_DIAGNOSTIC_SENSORS, DEFAULT_DIAGNOSTIC_SENSORS):
+        aggregates.append(PetrolMapRefreshDurationSensor(coordinator, config_entry))
+        # The request counters are integration-wide, so only the first entry with diagnostics provides them
+        domain_data = hass.data[DOMAIN]
+        if domain_data.setdefault("requests_sensor_entry", config_entry.entry_id) == config_entry.entry_id:
+            aggregates.append(PetrolMapRequestsSensor(hass))
+            config_entry.async_on_unload(lambda: domain_data.pop("requests_sensor_entry", None))
+    # Each entry used to have its own copy of the request counters
+    registry = er.async_get(hass)
+    legacy = registry.async_get_entity_id("sensor", DOMAIN, f"{config_entry.entry_id}_diagnostic_upstream_requests")
+    if legacy is not None:
+        registry.async_remove(legacy)
+    async_add_entities(aggregates)
+
+    if not config.get(CONF_STATION_SENSORS, DEFAULT_STATION_SENSORS):
+        # Aggregates only: drop per-station entities and devices left over from when they were enabled
+        keep = {entity.unique_id for entity in aggregates}
+        for entry in er.async_entries_for_config_entry(registry, config_entry.entry_id):
+            if entry.domain == "sensor" and entry.unique_id not in keep:
+                registry.async_remove(entry.entity_id)
+        device_registry = dr.async_get(hass)
+        for device in dr.async_entries_for_config_entry(device_registry, config_entry.entry_id):
+            device_registry.async_update_device(device.id, remove_config_entry_id=config_entry.entry_id)
         return
 
-    for station_id, station in data["stations"].items():
-        _LOGGER.debug(f"Processing station: {station}")
-        for fuel_type in station.get("prices", {}):
-            fuel_name = FUEL_TYPE_NAMES.get(int(fuel_type), "Unknown")
-            if station["prices"].get(fuel_type):
-                entities.append(PetrolMapSensor(coordinator, config_entry, station, fuel_type, fuel_name))
+    known = set()
+    known_stations = set()
+
+    def _build_sensors(keys):
+        entities = []
+        for station_id, fuel_type in keys:
+            station = coordinator.get_station(station_id)
+            if station is None or (station_id, fuel_type) in known:
+                continue
+            if station_id not in known_stations:
+                known_stations.add(station_id)
+                entities.append(PetrolMapStationSensor(coordinator, config_entry, station))
+            known.add((station_id, fuel_type))
+            fuel_name = FUEL_TYPE_NAMES.get(fuel_type, "Unknown")
+            entities.append(PetrolMapSensor(coordinator, config_entry, station, fuel_type, fuel_name))
+        return entities
+
+    def _restore_missing_sensors(index):
+        """Recreate the entities of stations and prices that were missing when Home Assistant stopped.
+
+        They come back unavailable with their grace period restarted, so they keep
+        their registry settings until they are reported again or retired. Entities
+        of stations the index no longer knows are removed.
+        """
+        registry = er.async_get(hass)
+        prefix = f"{config_entry.entry_id}_"
+        entities, keys, station_ids = [], set(), set()
+        for entry in er.async_entries_for_config_entry(registry, config_entry.entry_id):
+            station_id, _, fuel_type = entry.unique_id.removeprefix(prefix).partition("_")
+            if entry.domain != "sensor" or not station_id.isdigit() or not (fuel_type or "0").isdigit():
+                continue
+            key = (station_id, int(fuel_type)) if fuel_type else None
+            if key in known or (key is None and station_id in known_stations):
+                continue
+            station = coordinator.get_station(station_id) or index.get(station_id)
+            if station is None:
+                registry.async_remove(entry.entity_id)
+            elif key is None:
+                known_stations.add(station_id)
+                station_ids.add(station_id)
+                entities.append(PetrolMapStationSensor(coordinator, config_entry, station))
             else:
-                _LOGGER.debug(f"No price data for fuel type {fuel_name} in station {station.get('name', 'Unknown')}")
+                known.add(key)
+                keys.add(key)
+                fuel_name = FUEL_TYPE_NAMES.get(key[1], "Unknown")
+                entities.append(PetrolMapSensor(coordinator, config_entry, station, key[1], fuel_name))
+        coordinator.async_set_missing(keys, station_ids)
+        return entities
 
+    @callback
+    def _async_sync_sensors():
+        """Add sensors for new station prices; retired ones remove themselves."""
+        known.difference_update(coordinator.removed)
+        known_stations.difference_update(coordinator.stations_removed)
+        entities = _build_sensors(coordinator.added)
+        if entities:
+            _LOGGER.debug("Adding %d new entities", len(entities))
+            async_add_entities(entities)
+
+    stations = (coordinator.data or {}).get("stations") or {}
+    entities = _build_sensors(
+        (station_id, fuel_type) for station_id, station in stations.items() for fuel_type in station.prices
+    )
+    entities.extend(_restore_missing_sensors(await async_get_station_index(hass)))
     if not entities:
-        _LOGGER.warning("No valid entities created from station data")
-        return
+        _LOGGER.warning("No valid station data available yet, sensors will be added as prices arrive")
+    else:
+        _LOGGER.debug("Adding %d entities", len(entities))
+        async_add_entities(entities)
+    config_entry.async_on_unload(coordinator.async_add_listener(_async_sync_sensors))
 
-    _LOGGER.debug(f"Adding entities: {[e.name for e in entities]}")
-    async_add_entities(entities)
+def _station_device_info(station):
+    """Return the device shared by every entity of a station, across config entries."""
+    return DeviceInfo(
+        identifiers={(DOMAIN, station.id)},
+        name=station.name,
+        manufacturer=station.brand,
+        model="Fuel station",
+    )
 
 class PetrolMapSensor(CoordinatorEntity, SensorEntity):
-    """Representation of a PetrolMap sensor."""
+    """Price of one fuel at a station; station details live on PetrolMapStationSensor."""
+
+    _unrecorded_attributes = frozenset({"fuel_type"})
 
     def __init__(self, coordinator, config_entry, station, fuel_type, fuel_name):
         super().__init__(coordinator)
         self._station = station
+        self._key = (station.id, fuel_type)
         self._fuel_type = fuel_type
         self._fuel_name = fuel_name
         self._config_entry = config_entry
-        self._attr_unique_id = f"{config_entry.entry_id}_{station['id']}_{fuel_type}"
-        self._attr_name = f"PetrolMap {station['name']} {fuel_name}".replace(" ", "_").lower()
+        self._attr_unique_id = f"{config_entry.entry_id}_{station.id}_{fuel_type}"
+        self._attr_name = f"PetrolMap {station.name} {fuel_name}".replace(" ", "_").lower()
         self._attr_unit_of_measurement = "£/L"
-        _LOGGER.debug(f"Created sensor: {self._attr_name}, unique_id: {self._attr_unique_id}")
+        self._attr_device_info = _station_device_info(station)
+        self._history = coordinator.hass.data[DOMAIN]["price_history"]
+        self._stats = None
+        _LOGGER.debug("Created sensor: %s, unique_id: %s", self._attr_name, self._attr_unique_id)
+
+    @property
+    def available(self):
+        """Unavailable while the station has stopped reporting this fuel."""
+        return super().available and self._key not in self.coordinator.missing
+
+    @callback
+    def _handle_coordinator_update(self):
+        """Write state only if this station's price, its rolling statistics or its availability changed."""
+        coordinator = self.coordinator
+        if self._key in coordinator.removed:
+            _LOGGER.debug("Retiring sensor %s: station stopped reporting this fuel", self.entity_id)
+            registry = er.async_get(self.hass)
+            if registry.async_get(self.entity_id):
+                registry.async_remove(self.entity_id)
+            else:
+                self.hass.async_create_task(self.async_remove())
+            return
+        if self._key in coordinator.changed:
+            self._station = coordinator.get_station(self._station.id) or self._station
+        elif (
+            self._key not in coordinator.vanished
+            and not coordinator.availability_changed
+            and self._history.stats(*self._key) == self._stats
+        ):
+            return
+        self.async_write_ha_state()
 
     @property
     def state(self):
         """Return the state of the sensor."""
-        price = self._station.get("prices", {}).get(str(self._fuel_type))
-        _LOGGER.debug(f"State for {self._attr_name}: {price}")
-        return f"{price:.2f}" if price else "unknown"
+        price = self._station.prices.get(self._fuel_type)
+        return f"{price.value:.2f}" if price else "unknown"
 
     @property
     def extra_state_attributes(self):
-        """Return additional state attributes."""
-        attrs = {
-            "station_name": self._station.get("name"),
+        """Return the price's recorded time and trend statistics."""
+        station = self._station
+        price = station.prices.get(self._fuel_type)
+        self._stats = self._history.stats(station.id, self._fuel_type)
+        return {
             "fuel_type": self._fuel_name,
-            "address": self._station.get("address"),
-            "postcode": self._station.get("postcode"),
-            "last_updated": self._station.get("last_updated"),
-            "brand": self._station.get("brand"),
-            "features": self._station.get("features", []),
-            "latitude": self._station.get("latitude"),
-            "longitude": self._station.get("longitude")
+            "last_updated": price.recorded if price else station.last_updated,
+            **self._stats,
+        }
+
+class PetrolMapStationSensor(CoordinatorEntity, SensorEntity):
+    """One per station: its most recent price update, with the static station details.
+
+    The details are excluded from the recorder, so database growth follows price
+    changes rather than the size of each station's record.
+    """
+
+    _unrecorded_attributes = frozenset(
+        {"station_name", "address", "postcode", "brand", "features", "latitude", "longitude"}
+    )
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+
+    def __init__(self, coordinator, config_entry, station):
+        super().__init__(coordinator)
+        self._station = station
+        self._entry_id = config_entry.entry_id
+        self._attr_unique_id = f"{config_entry.entry_id}_{station.id}"
+        self._attr_name = f"PetrolMap {station.name}".replace(" ", "_").lower()
+        self._attr_icon = "mdi:gas-station"
+        self._attr_device_info = _station_device_info(station)
+
+    @property
+    def available(self):
+        """Unavailable while the station has stopped being reported."""
+        return super().available and self._station.id not in self.coordinator.stations_missing
+
+    @callback
+    def _handle_coordinator_update(self):
+        """Write state only if the station's details, latest update or availability changed."""
+        coordinator = self.coordinator
+        station_id = self._station.id
+        if station_id in coordinator.stations_removed:
+            _LOGGER.debug("Retiring station sensor %s: station not reported for too long", self.entity_id)
+            if self.device_entry is not None:
+                # Other config entries that still see the station keep the device
+                dr.async_get(self.hass).async_update_device(
+                    self.device_entry.id, remove_config_entry_id=self._entry_id
+                )
+            registry = er.async_get(self.hass)
+            if registry.async_get(self.entity_id):
+                registry.async_remove(self.entity_id)
+            else:
+                self.hass.async_create_task(self.async_remove())
+            return
+        if station_id in coordinator.stations_changed:
+            self._station = coordinator.get_station(station_id) or self._station
+        elif station_id not in coordinator.stations_vanished and not coordinator.availability_changed:
+            return
+        self.async_write_ha_state()
+
+    @property
+    def native_value(self):
+        """Return when any of the station's prices was last recorded."""
+        last_updated = self._station.last_updated
+        return dt_util.parse_datetime(last_updated) if last_updated else None
+
+    @property
+    def extra_state_attributes(self):
+        station = self._station
+        return {
+            "station_name": station.name,
+            "address": station.address,
+            "postcode": station.postcode,
+            "brand": station.brand,
+            "features": station.features,
+            "latitude": station.latitude,
+            "longitude": station.longitude,
+        }
+
+class PetrolMapCheapestSensor(CoordinatorEntity, SensorEntity):
+    """Cheapest price of one fuel type across the entry's stations, optionally within a radius."""
+
+    _unrecorded_attributes = frozenset({"address", "postcode", "brand", "top"})
+
+    def __init__(self, coordinator, config_entry, fuel_type, fuel_name, top_n, radius=None):
+        super().__init__(coordinator)
+        self._fuel_type = fuel_type
+        self._fuel_name = fuel_name
+        self._top_n = top_n
+        self._radius = radius
+        self._view = None
+        postcode = get_entry_config(config_entry)[CONF_POSTCODE]
+        if radius:
+            self._attr_unique_id = f"{config_entry.entry_id}_cheapest_{fuel_type}_within_{radius}"
+            self._attr_name = f"PetrolMap {postcode} Cheapest {fuel_name} Within {radius} Miles".replace(" ", "_").lower()
+        else:
+            self._attr_unique_id = f"{config_entry.entry_id}_cheapest_{fuel_type}"
+            self._attr_name = f"PetrolMap {postcode} Cheapest {fuel_name}".replace(" ", "_").lower()
+        self._attr_unit_of_measurement = "£/L"
+
+    def _current_view(self):
+        """Return the ranking entries this sensor shows, in display order."""
+        ranking = self.coordinator.rankings.get(self._fuel_type)
+        if ranking is None:
+            return ()
+        if self._radius:
+            cheapest = ranking.cheapest_within(self._radius)
+            return (cheapest,) if cheapest else ()
+        return tuple(ranking.top(self._top_n))
+
+    @callback
+    def _handle_coordinator_update(self):
+        """Write state only if the ranked stations or their prices changed."""
+        view = self._current_view()
+        if view == self._view and not self.coordinator.availability_changed:
+            return
+        self._view = view
+        self.async_write_ha_state()
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self._view = self._current_view()
+
+    @property
+    def state(self):
+        """Return the cheapest price."""
+        view = self._view or ()
+        return f"{view[0][0]:.2f}" if view else "unknown"
+
+    def _describe(self, entry):
+        price, distance, station_id = entry
+        station = self.coordinator.get_station(station_id)
+        return {
+            "station_name": station.name if station else None,
+            "price": round(price, 2),
+            "distance": distance if distance != float("inf") else None,
+            "brand": station.brand if station else None,
+            "address": station.address if station else None,
+            "postcode": station.postcode if station else None,
         }
-        _LOGGER.debug(f"Attributes for {self._attr_name}: {attrs}")
-        return attrs
\ No newline at end of file
+
+    @property
+    def extra_state_attributes(self):
+        """Return the cheapest station, and the top stations when not radius-limited."""
+        view = self._view or ()
+        attrs = {"fuel_type": self._fuel_name}
+        if self._radius:
+            attrs["radius"] = self._radius
+        if not view:
+            return attrs
+        cheapest = self._describe(view[0])
+        station = self.coordinator.get_station(view[0][2])
+        attrs.update(cheapest)
+        attrs["last_updated"] = station.prices[self._fuel_type].recorded if station else None
+        if not self._radius:
+            attrs["top"] = [self._describe(entry) for entry in view]
+        return attrs
+
+class PetrolMapRefreshDurationSensor(CoordinatorEntity, SensorEntity):
+    """Duration of the entry's last refresh, with its per-phase breakdown."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+
+    def __init__(self, coordinator, config_entry):
+        super().__init__(coordinator)
+        self._entry_id = config_entry.entry_id
+        self._metrics = async_get_metrics(coordinator.hass)
+        postcode = get_entry_config(config_entry)[CONF_POSTCODE]
+        self._attr_unique_id = f"{config_entry.entry_id}_diagnostic_refresh_duration"
+        self._attr_name = f"PetrolMap {postcode} Refresh Duration".replace(" ", "_").lower()
+
+    @property
+    def native_value(self):
+        last = self._metrics.last_refresh.get(self._entry_id)
+        return last["duration"] if last else None
+
+    @property
+    def extra_state_attributes(self):
+        last = self._metrics.last_refresh.get(self._entry_id) or {}
+        return {"success": last.get("success"), "stations": last.get("stations"), **last.get("phases", {})}
+
+class PetrolMapRequestsSensor(SensorEntity):
+    """Upstream requests made by all config entries, with the other pipeline counters.
+
+    The counters change with every refresh, so they are kept out of the recorder;
+    only the request total is recorded.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_should_poll = False
+    _unrecorded_attributes = frozenset(COUNTERS)
+
+    def __init__(self, hass):
+        self._metrics = async_get_metrics(hass)
+        self._attr_unique_id = f"{DOMAIN}_upstream_requests"
+        self._attr_name = "PetrolMap Upstream Requests".replace(" ", "_").lower()
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_dispatcher_connect(self.hass, SIGNAL_METRICS_UPDATED, self.async_write_ha_state)
+        )
+
+    @property
+    def native_value(self):
+        return self._metrics.counters.get("requests", 0)
+
+    @property
+    def extra_state_attributes(self):
+        counters = self._metrics.counters
+        return {counter: counters.get(counter, 0) for counter in COUNTERS if counter != "requests"}
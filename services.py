@@ -0,0 +1,101 @@
+# services.py
+import logging
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
+from homeassistant.exceptions import ServiceValidationError
+import homeassistant.helpers.config_validation as cv
+from .const import DOMAIN, FUEL_TYPE_NAMES, SERVICE_FIND_STATIONS
+from .spatial import async_get_station_index
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_LATITUDE = "latitude"
+ATTR_LONGITUDE = "longitude"
+ATTR_RADIUS = "radius"
+ATTR_ROUTE = "route"
+ATTR_DISTANCE = "distance"
+ATTR_FUEL_TYPE = "fuel_type"
+ATTR_LIMIT = "limit"
+
+_FUEL_TYPES_BY_NAME = {name.lower(): fuel_type for fuel_type, name in FUEL_TYPE_NAMES.items()}
+
+def _route_point(value):
+    """Accept [lat, lng] pairs or {"latitude": .., "longitude": ..} mappings."""
+    if isinstance(value, dict):
+        value = (value.get(ATTR_LATITUDE), value.get(ATTR_LONGITUDE))
+    try:
+        lat, lng = value
+        return cv.latitude(lat), cv.longitude(lng)
+    except (TypeError, ValueError) as e:
+        raise vol.Invalid(f"Invalid route point {value}: {str(e)}")
+
+def _fuel_type(value):
+    if isinstance(value, int) and value in FUEL_TYPE_NAMES:
+        return value
+    fuel_type = _FUEL_TYPES_BY_NAME.get(str(value).strip().lower())
+    if fuel_type is None:
+        raise vol.Invalid(f"Unknown fuel type {value}, expected one of {', '.join(FUEL_TYPE_NAMES.values())}")
+    return fuel_type
+
+FIND_STATIONS_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_LATITUDE): cv.latitude,
+    vol.Optional(ATTR_LONGITUDE): cv.longitude,
+    vol.Optional(ATTR_RADIUS, default=5): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(ATTR_ROUTE): vol.All(cv.ensure_list, [_route_point], vol.Length(min=1)),
+    vol.Optional(ATTR_DISTANCE, default=1): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(ATTR_FUEL_TYPE): _fuel_type,
+    vol.Optional(ATTR_LIMIT, default=20): vol.All(vol.Coerce(int), vol.Range(min=1, max=500)),
+})
+
+def _describe(distance, station, fuel_type):
+    prices = station.prices if fuel_type is None else {fuel_type: station.prices[fuel_type]}
+    return {
+        "id": station.id,
+        "name": station.name,
+        "address": station.address,
+        "postcode": station.postcode,
+        "brand": station.brand,
+        "latitude": station.latitude,
+        "longitude": station.longitude,
+        "distance": round(distance, 2),
+        "prices": {
+            FUEL_TYPE_NAMES.get(price_fuel_type, str(price_fuel_type)): {"price": price.value, "recorded": price.recorded}
+            for price_fuel_type, price in prices.items()
+        },
+    }
+
+def async_register_services(hass: HomeAssistant):
+    """Register the integration's services once, for all config entries."""
+    if hass.services.has_service(DOMAIN, SERVICE_FIND_STATIONS):
+        return
+
+    async def _async_find_stations(call: ServiceCall):
+        """Answer radius and route-corridor queries from the local station index."""
+        index = await async_get_station_index(hass)
+        fuel_type = call.data.get(ATTR_FUEL_TYPE)
+        if ATTR_ROUTE in call.data:
+            matches = index.near_route(call.data[ATTR_ROUTE], call.data[ATTR_DISTANCE])
+        else:
+            if (ATTR_LATITUDE in call.data) != (ATTR_LONGITUDE in call.data):
+                raise ServiceValidationError("Provide both latitude and longitude, or neither to use the home location")
+            lat = call.data.get(ATTR_LATITUDE, hass.config.latitude)
+            lng = call.data.get(ATTR_LONGITUDE, hass.config.longitude)
+            matches = index.within_radius(lat, lng, call.data[ATTR_RADIUS])
+        if fuel_type is not None:
+            # Cheapest first for a specific fuel, nearest breaking ties
+            matches = [match for match in matches if fuel_type in match[1].prices]
+            matches.sort(key=lambda match: (match[1].prices[fuel_type].value, match[0]))
+        _LOGGER.debug("%s matched %d of %d known stations", SERVICE_FIND_STATIONS, len(matches), len(index))
+        return {
+            "stations": [
+                _describe(distance, station, fuel_type) for distance, station in matches[:call.data[ATTR_LIMIT]]
+            ]
+        }
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_FIND_STATIONS, _async_find_stations,
+        schema=FIND_STATIONS_SCHEMA, supports_response=SupportsResponse.ONLY,
+    )
+
+def async_unregister_services(hass: HomeAssistant):
+    hass.services.async_remove(DOMAIN, SERVICE_FIND_STATIONS)
\ No newline at end of file
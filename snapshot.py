@@ -0,0 +1,70 @@
+# snapshot.py
+import logging
+from datetime import datetime, timezone
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import (
+    DOMAIN, CONF_POSTCODE, CONF_DISTANCE, CONF_API_KEY, STORAGE_VERSION, STORAGE_SAVE_DELAY, SNAPSHOT_STORAGE_KEY
+)
+from .models import Station
+
+_LOGGER = logging.getLogger(__name__)
+
+def _get_store(hass: HomeAssistant, entry_id) -> Store:
+    stores = hass.data[DOMAIN].setdefault("snapshot_stores", {})
+    store = stores.get(entry_id)
+    if store is None:
+        store = stores[entry_id] = Store(hass, STORAGE_VERSION, SNAPSHOT_STORAGE_KEY.format(entry_id=entry_id))
+    return store
+
+def _snapshot_config(config):
+    """Return the settings that decide which stations a snapshot holds."""
+    return {
+        "postcode": config[CONF_POSTCODE],
+        "distance": config[CONF_DISTANCE],
+        "api_key": bool(config.get(CONF_API_KEY)),
+    }
+
+async def async_load_snapshot(hass: HomeAssistant, entry_id, config):
+    """Return the last good coordinator data persisted for an entry, or None.
+
+    A snapshot taken under a different postcode, distance or API key setting is
+    ignored, so stations outside the new area never get entities.
+    """
+    try:
+        stored = await _get_store(hass, entry_id).async_load()
+    except Exception as e:
+        _LOGGER.warning(f"Could not load snapshot for entry_id {entry_id}: {str(e)}")
+        return None
+    if not stored or not stored.get("stations"):
+        return None
+    if stored.get("config") != _snapshot_config(config):
+        _LOGGER.debug(f"Ignoring snapshot for entry_id {entry_id} taken with different settings")
+        return None
+    try:
+        stations = {station_id: Station.from_dict(station) for station_id, station in stored["stations"].items()}
+    except (KeyError, TypeError, ValueError) as e:
+        _LOGGER.warning(f"Ignoring unreadable snapshot for entry_id {entry_id}: {str(e)}")
+        return None
+    _LOGGER.debug(f"Restored {len(stations)} stations for entry_id {entry_id} from snapshot taken {stored.get('saved_at')}")
+    center = stored.get("center")
+    return {"stations": stations, "center": tuple(center) if center else None}
+
+def async_save_snapshot(hass: HomeAssistant, entry_id, data, config):
+    """Schedule coordinator data to be persisted as the entry's last good snapshot."""
+    saved_at = datetime.now(timezone.utc).isoformat()
+    snapshot_config = _snapshot_config(config)
+    _get_store(hass, entry_id).async_delay_save(
+        lambda: {
+            "saved_at": saved_at,
+            "config": snapshot_config,
+            "center": data.get("center"),
+            "stations": {station_id: station.as_dict() for station_id, station in data["stations"].items()},
+        },
+        STORAGE_SAVE_DELAY,
+    )
+
+async def async_remove_snapshot(hass: HomeAssistant, entry_id):
+    """Delete the persisted snapshot of a removed entry."""
+    await _get_store(hass, entry_id).async_remove()
+    hass.data[DOMAIN]["snapshot_stores"].pop(entry_id, None)
@@ -0,0 +1,128 @@
+# spatial.py
+import logging
+import math
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from .const import STORAGE_VERSION, STORAGE_SAVE_DELAY, STATIONS_STORAGE_KEY, SPATIAL_CELL_DEGREES
+from .api import async_get_loaded
+from .geo import EARTH_RADIUS_MILES, haversine_miles, point_segment_miles
+from .models import Station
+
+_LOGGER = logging.getLogger(__name__)
+
+_MILES_PER_DEGREE = EARTH_RADIUS_MILES * math.pi / 180
+
+def _cell(lat, lng):
+    return int(math.floor(lat / SPATIAL_CELL_DEGREES)), int(math.floor(lng / SPATIAL_CELL_DEGREES))
+
+def _cells_in_box(min_lat, min_lng, max_lat, max_lng):
+    (low_lat, low_lng), (high_lat, high_lng) = _cell(min_lat, min_lng), _cell(max_lat, max_lng)
+    return [
+        (cell_lat, cell_lng)
+        for cell_lat in range(low_lat, high_lat + 1)
+        for cell_lng in range(low_lng, high_lng + 1)
+    ]
+
+def _box_around(lat, lng, miles):
+    """Return (min_lat, min_lng, max_lat, max_lng) enclosing a circle of miles around a point."""
+    dlat = miles / _MILES_PER_DEGREE
+    dlng = miles / (_MILES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+class StationIndex:
+    """Grid index over every station seen by any config entry.
+
+    Stations are bucketed into SPATIAL_CELL_DEGREES cells, so a radius or route
+    query only measures the stations in the cells it overlaps. The latest record
+    of each station is persisted, so queries work across restarts without
+    touching the API.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._store = Store(hass, STORAGE_VERSION, STATIONS_STORAGE_KEY)
+        self._stations = {}
+        self._cells = {}
+
+    def __len__(self):
+        return len(self._stations)
+
+    async def async_load(self):
+        stored = await self._store.async_load() or {}
+        for data in stored.get("stations", {}).values():
+            try:
+                self._insert(Station.from_dict(data))
+            except (KeyError, TypeError, ValueError):
+                continue
+        _LOGGER.debug(f"Loaded {len(self._stations)} stations into the spatial index")
+
+    def _insert(self, station):
+        old = self._stations.get(station.id)
+        if old is not None and old.latitude is not None:
+            cell = self._cells.get(_cell(old.latitude, old.longitude))
+            if cell is not None:
+                cell.discard(station.id)
+        self._stations[station.id] = station
+        if station.latitude is not None and station.longitude is not None:
+            self._cells.setdefault(_cell(station.latitude, station.longitude), set()).add(station.id)
+
+    @callback
+    def async_update(self, stations):
+        """Add or refresh stations (station id -> Station)."""
+        for station in stations.values():
+            self._insert(station)
+        if stations:
+            self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    def _data_to_save(self):
+        return {"stations": {station_id: station.as_dict() for station_id, station in self._stations.items()}}
+
+    def get(self, station_id):
+        return self._stations.get(station_id)
+
+    def within_radius(self, lat, lng, radius, station_ids=None):
+        """Return (distance, Station) pairs within radius miles of a point, nearest first.
+
+        If station_ids is given, only those stations are considered.
+        """
+        results = []
+        for cell in _cells_in_box(*_box_around(lat, lng, radius)):
+            for station_id in self._cells.get(cell, ()):
+                if station_ids is not None and station_id not in station_ids:
+                    continue
+                station = self._stations[station_id]
+                distance = haversine_miles(lat, lng, station.latitude, station.longitude)
+                if distance <= radius:
+                    results.append((distance, station))
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def near_route(self, points, distance):
+        """Return (distance, Station) pairs within distance miles of a polyline of (lat, lng) points."""
+        if len(points) == 1:
+            return self.within_radius(points[0][0], points[0][1], distance)
+        candidates = {}
+        for index, (start, end) in enumerate(zip(points, points[1:])):
+            start_box = _box_around(start[0], start[1], distance)
+            end_box = _box_around(end[0], end[1], distance)
+            box = (
+                min(start_box[0], end_box[0]), min(start_box[1], end_box[1]),
+                max(start_box[2], end_box[2]), max(start_box[3], end_box[3]),
+            )
+            for cell in _cells_in_box(*box):
+                for station_id in self._cells.get(cell, ()):
+                    candidates.setdefault(station_id, []).append(index)
+        results = []
+        for station_id, segments in candidates.items():
+            station = self._stations[station_id]
+            nearest = min(
+                point_segment_miles(station.latitude, station.longitude, points[index], points[index + 1])
+                for index in segments
+            )
+            if nearest <= distance:
+                results.append((nearest, station))
+        results.sort(key=lambda result: result[0])
+        return results
+
+async def async_get_station_index(hass: HomeAssistant) -> StationIndex:
+    """Return the shared station index, loading it from disk on first use."""
+    return await async_get_loaded(hass, "station_index", StationIndex)
\ No newline at end of file